@@ -2,11 +2,20 @@
 Main Telegram Bot for Commission Tracker
 """
 
+import csv
+import io
 import logging
 import asyncio
+import functools
+import heapq
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
-from datetime import datetime
-import pytz
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
 from aiohttp import web
 from telegram import (
     Update,
@@ -31,9 +40,9 @@ from database import Database
 from utils import (
     get_current_month_year,
     parse_amount,
+    split_commission,
     is_near_month_rollover,
     format_kes,
-    is_duplicate,
     is_extreme_amount,
     parse_month_year,
 )
@@ -53,25 +62,167 @@ logger = logging.getLogger(__name__)
 # Global database instance
 db = Database()
 
-# Store last commission for undo
-last_commissions = {}  # {user_id: {commission_id, timestamp}}
+# Configured timezone, resolved once
+_TZ = ZoneInfo(config.DEFAULT_TIMEZONE)
+
+# Bot owner's user ID (0 when unset)
+_OWNER_ID = config.OWNER_USER_ID
+
+_ZERO = Decimal("0")
+
+# Store last commission for undo, oldest first
+last_commissions: OrderedDict[int, dict] = OrderedDict()  # {user_id: {commission_id, timestamp}}
+LAST_COMMISSIONS_MAX = 10_000
+
+# Worker threads for blocking database calls
+DB_EXECUTOR_WORKERS = 8
+
+# Maximum scheduler messages in flight at once (keeps under Telegram flood limits)
+BROADCAST_CONCURRENCY = getattr(config, "BROADCAST_CONCURRENCY", 20)
+
+# Leading token of a commission message, e.g. "7500" or "7,500.50"
+_AMOUNT_RE = re.compile(r"^\d[\d,]*(?:\.\d+)?$")
+
+# Message handler filters
+COMMISSION_MESSAGE_RE = re.compile(r"^\s*\d[\d.,]*(\s|$)")
+YES_NO_RE = re.compile(r"^\s*(yes|no)\s*$", re.IGNORECASE)
+
+# Static inline keyboards, built once (PTB objects are immutable)
+WELCOME_MARKUP = InlineKeyboardMarkup(
+    [
+        [
+            InlineKeyboardButton("📊 Dashboard", callback_data="dashboard"),
+            InlineKeyboardButton("💰 Balance", callback_data="balance"),
+        ],
+        [
+            InlineKeyboardButton("📈 Stats Month", callback_data="stats_month"),
+            InlineKeyboardButton("📅 Stats Year", callback_data="stats_year"),
+        ],
+        [
+            InlineKeyboardButton("📤 Export CSV", callback_data="export"),
+            InlineKeyboardButton("⚙️ Settings", callback_data="settings"),
+        ],
+    ]
+)
+CLEAR_DB_MARKUP = InlineKeyboardMarkup(
+    [
+        [
+            InlineKeyboardButton("✅ Confirm Clear", callback_data="clear_db_confirm"),
+            InlineKeyboardButton("❌ Cancel", callback_data="clear_db_cancel"),
+        ]
+    ]
+)
+
+# Bot menu commands, set in post_init and setup_menu_buttons
+BOT_COMMANDS = [
+    BotCommand("start", "Start the bot and see welcome message"),
+    BotCommand("dashboard", "View current month dashboard"),
+    BotCommand("balance", "Show balance and owed amounts"),
+    BotCommand("paid", "Record payout to partner"),
+    BotCommand("undo", "Undo last commission entry"),
+    BotCommand("stats", "View statistics (month or year)"),
+    BotCommand("yearly", "View yearly summary"),
+    BotCommand("export", "Export CSV data"),
+    BotCommand("settings", "View bot settings"),
+    BotCommand("approve", "Approve user access (owner only)"),
+    BotCommand("revoke", "Revoke user access (owner only)"),
+    BotCommand("clear_db", "Clear all database data (owner only)"),
+]
+MENU_BUTTON = MenuButtonCommands()
+
+# Authorized user IDs, loaded on first use and kept in sync on approve/revoke
+_authorized_cache: set[int] = set()
+_cache_loaded = False
+
+# All users for the scheduler jobs, refreshed after USERS_CACHE_TTL seconds or on change
+_users_cache: list[sqlite3.Row] | None = None
+_users_cache_ts = 0.0
+USERS_CACHE_TTL = 300
+
+
+async def _db(fn, *args, **kwargs):
+    """Run a blocking database call in the executor so the event loop stays free"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(fn, *args, **kwargs))
+
+
+def auth_request_markup(user_id: int) -> InlineKeyboardMarkup:
+    """Approve/deny buttons for an authorization request"""
+    return InlineKeyboardMarkup(
+        [
+            [
+                InlineKeyboardButton("✅ Approve", callback_data=f"auth_approve_{user_id}"),
+                InlineKeyboardButton("❌ Deny", callback_data=f"auth_deny_{user_id}"),
+            ]
+        ]
+    )
 
 
 def get_current_time():
     """Get current time in the configured timezone"""
-    tz = pytz.timezone(config.DEFAULT_TIMEZONE)
-    return datetime.now(tz)
+    return datetime.now(_TZ)
+
+
+def _load_authorized_cache():
+    """Populate the authorized user cache from the database once"""
+    global _cache_loaded
+    if not _cache_loaded:
+        _authorized_cache.update(u["user_id"] for u in db.get_authorized_users())
+        _cache_loaded = True
+
 
+def remember_commission(user_id: int, commission_id: int):
+    """Record the last commission for undo and prune expired entries"""
+    now = time.monotonic()
+    last_commissions[user_id] = {"commission_id": commission_id, "timestamp": now}
+    last_commissions.move_to_end(user_id)
+
+    # Entries are ordered by timestamp, so expired ones sit at the front
+    cutoff = now - config.UNDO_WINDOW_MINUTES * 60
+    while last_commissions and (
+        len(last_commissions) > LAST_COMMISSIONS_MAX
+        or next(iter(last_commissions.values()))["timestamp"] < cutoff
+    ):
+        last_commissions.popitem(last=False)
+
+
+async def _cached_users() -> list[sqlite3.Row]:
+    """Get all users, served from memory while the cache is fresh"""
+    global _users_cache, _users_cache_ts
+    now = time.monotonic()
+    if _users_cache is None or now - _users_cache_ts >= USERS_CACHE_TTL:
+        _users_cache = await _db(db.get_all_users)
+        _users_cache_ts = now
+    return _users_cache
+
+
+def _invalidate_users_cache():
+    """Drop the cached user list so the next job reloads it"""
+    global _users_cache
+    _users_cache = None
+
+
+def check_authorization(user_id: int, name: str = None) -> bool:
+    """Check if user is authorized (name is used if the owner gets auto-approved)"""
+    _load_authorized_cache()
 
-def check_authorization(user_id: int) -> bool:
-    """Check if user is authorized"""
     # Owner is always authorized
-    if config.OWNER_USER_ID and user_id == config.OWNER_USER_ID:
+    if _OWNER_ID and user_id == _OWNER_ID:
         # Auto-authorize owner on first use
-        if not db.is_authorized(user_id):
-            db.approve_user(user_id, user_id)
+        if user_id not in _authorized_cache:
+            db.approve_user(user_id, user_id, name)
+            _authorized_cache.add(user_id)
+            _invalidate_users_cache()
         return True
-    return db.is_authorized(user_id)
+    return user_id in _authorized_cache
+
+
+def _get_authorized_ids() -> set[int]:
+    """Snapshot of authorized user IDs (owner included) for bulk filtering"""
+    _load_authorized_cache()
+    if _OWNER_ID:
+        return _authorized_cache | {_OWNER_ID}
+    return set(_authorized_cache)
 
 
 async def require_authorization(
@@ -83,7 +234,7 @@ async def require_authorization(
 
     user_id = update.effective_user.id
 
-    if check_authorization(user_id):
+    if check_authorization(user_id, update.effective_user.full_name):
         return True
 
     # Not authorized - send message
@@ -109,44 +260,38 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     user = update.effective_user
     user_id = user.id
-    db.get_or_create_user(user_id, user.full_name)
+    await _db(db.get_or_create_user, user_id, user.full_name)
 
     # Check if user is authorized
-    if not check_authorization(user_id):
+    if not check_authorization(user_id, user.full_name):
         # Not authorized - create pending request and notify owner
-        db.add_pending_authorization(
-            user_id, user.username or None, user.full_name or None
+        await _db(
+            db.add_pending_authorization,
+            user_id,
+            user.username or None,
+            user.full_name or None,
         )
 
         # Notify owner
-        if config.OWNER_USER_ID:
+        if _OWNER_ID:
             try:
-                keyboard = [
-                    [
-                        InlineKeyboardButton(
-                            "✅ Approve", callback_data=f"auth_approve_{user_id}"
-                        ),
-                        InlineKeyboardButton(
-                            "❌ Deny", callback_data=f"auth_deny_{user_id}"
-                        ),
-                    ]
+                parts = [
+                    "🔔 **New Authorization Request**\n\n",
+                    f"👤 User: {user.full_name or 'Unknown'}\n",
+                    f"🆔 ID: `{user_id}`\n",
                 ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-
-                owner_message = "🔔 **New Authorization Request**\n\n"
-                owner_message += f"👤 User: {user.full_name or 'Unknown'}\n"
-                owner_message += f"🆔 ID: `{user_id}`\n"
                 if user.username:
-                    owner_message += f"📱 Username: @{user.username}\n"
-                owner_message += (
+                    parts.append(f"📱 Username: @{user.username}\n")
+                parts.append(
                     f"\n⏰ Requested: {get_current_time().strftime('%Y-%m-%d %H:%M:%S')}\n"
                 )
-                owner_message += "\nChoose an action:"
+                parts.append("\nChoose an action:")
+                owner_message = "".join(parts)
 
                 await context.bot.send_message(
-                    chat_id=config.OWNER_USER_ID,
+                    chat_id=_OWNER_ID,
                     text=owner_message,
-                    reply_markup=reply_markup,
+                    reply_markup=auth_request_markup(user_id),
                     parse_mode="Markdown",
                 )
             except Exception as e:
@@ -162,24 +307,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
 
-    # User is authorized - show welcome
-    # Create inline keyboard for quick actions
-    keyboard = [
-        [
-            InlineKeyboardButton("📊 Dashboard", callback_data="dashboard"),
-            InlineKeyboardButton("💰 Balance", callback_data="balance"),
-        ],
-        [
-            InlineKeyboardButton("📈 Stats Month", callback_data="stats_month"),
-            InlineKeyboardButton("📅 Stats Year", callback_data="stats_year"),
-        ],
-        [
-            InlineKeyboardButton("📤 Export CSV", callback_data="export"),
-            InlineKeyboardButton("⚙️ Settings", callback_data="settings"),
-        ],
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-
+    # User is authorized - show welcome with quick action buttons
     await update.message.reply_text(
         f"👋 Welcome to Commission Tracker Bot, {user.first_name}!\n\n"
         "📝 **How to use:**\n"
@@ -188,7 +316,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "• Use `solo` for full personal commission\n\n"
         "💡 **Quick Actions:** Use the buttons below or the menu button (☰) for commands!\n\n"
         "💡 Just send a number to get started!",
-        reply_markup=reply_markup,
+        reply_markup=WELCOME_MARKUP,
         parse_mode="Markdown",
     )
 
@@ -198,16 +326,18 @@ async def handle_commission_message(update: Update, context: ContextTypes.DEFAUL
     if not update.effective_user or not update.message or not update.message.text:
         return
 
+    # Parse amount and note; ignore chat text that isn't an amount
+    text = update.message.text.strip()
+    parts = text.split(maxsplit=1)
+    amount_str = parts[0] if parts else ""
+    if not _AMOUNT_RE.match(amount_str):
+        return
+    note = parts[1] if len(parts) > 1 else None
+
     if not await require_authorization(update, context):
         return
 
     user_id = update.effective_user.id
-    text = update.message.text.strip()
-
-    # Parse amount and note
-    parts = text.split(maxsplit=1)
-    amount_str = parts[0]
-    note = parts[1] if len(parts) > 1 else None
 
     # Check for "solo" override
     is_solo = note and note.lower() == "solo"
@@ -221,17 +351,12 @@ async def handle_commission_message(update: Update, context: ContextTypes.DEFAUL
         )
         return
 
-    # Get or create user
-    user_name = (
-        update.effective_user.full_name
-        if update.effective_user and update.effective_user.full_name
-        else f"User_{user_id}"
-    )
-    db.get_or_create_user(user_id, user_name)
+    month, year = get_current_month_year(user_id)
 
     # Check for duplicates
-    recent_commissions = db.get_commissions(user_id)[:5]  # Last 5
-    if is_duplicate(amount, recent_commissions, config.DUPLICATE_DETECTION_MINUTES):
+    if await _db(
+        db.has_recent_duplicate, user_id, amount, config.DUPLICATE_DETECTION_MINUTES
+    ):
         await update.message.reply_text(
             f"⚠️ Duplicate detected! Same amount ({format_kes(amount)}) was added recently.\n"
             "If this is correct, please confirm by sending the amount again."
@@ -239,25 +364,18 @@ async def handle_commission_message(update: Update, context: ContextTypes.DEFAUL
         return
 
     # Check for extreme amounts
-    if recent_commissions:
-        monthly_commissions = db.get_commissions(user_id)
-        if monthly_commissions:
-            monthly_total = sum(Decimal(c["amount"]) for c in monthly_commissions)
-            monthly_avg = (
-                monthly_total / Decimal(str(len(monthly_commissions)))
-                if monthly_commissions
-                else Decimal("0")
+    month_totals = await _db(db.get_monthly_totals, user_id, month, year)
+    if month_totals["entries_count"]:
+        monthly_avg = month_totals["total_commission"] / month_totals["entries_count"]
+        if is_extreme_amount(amount, monthly_avg, config.EXTREME_AMOUNT_MULTIPLIER):
+            ratio = float(amount / monthly_avg) if monthly_avg > 0 else 0.0
+            await update.message.reply_text(
+                f"⚠️ Large amount detected: {format_kes(amount)}\n"
+                f"This is {ratio:.1f}x the monthly average.\n"
+                "Please confirm this is correct."
             )
-            if is_extreme_amount(amount, monthly_avg, config.EXTREME_AMOUNT_MULTIPLIER):
-                ratio = float(amount / monthly_avg) if monthly_avg > 0 else 0.0
-                await update.message.reply_text(
-                    f"⚠️ Large amount detected: {format_kes(amount)}\n"
-                    f"This is {ratio:.1f}x the monthly average.\n"
-                    "Please confirm this is correct."
-                )
 
     # Handle month rollover confirmation
-    month, year = get_current_month_year(user_id)
     if is_near_month_rollover(user_id):
         # Ask for confirmation
         await update.message.reply_text(
@@ -279,16 +397,10 @@ async def handle_commission_message(update: Update, context: ContextTypes.DEFAUL
         return
 
     # Add commission
-    if is_solo:
-        split_user = Decimal(str(amount))
-        split_partner = Decimal("0")
-    else:
-        split_user = Decimal(str(amount)) * Decimal(str(config.DEFAULT_SPLIT_USER))
-        split_partner = Decimal(str(amount)) * Decimal(
-            str(config.DEFAULT_SPLIT_PARTNER)
-        )
+    split_user, split_partner = split_commission(amount, is_solo)
 
-    commission_id = db.add_commission(
+    commission_id = await _db(
+        db.add_commission,
         user_id=user_id,
         amount=amount,
         note=note or "",
@@ -299,30 +411,34 @@ async def handle_commission_message(update: Update, context: ContextTypes.DEFAUL
     )
 
     # Store for undo
-    last_commissions[user_id] = {
-        "commission_id": commission_id,
-        "timestamp": get_current_time(),
-    }
+    remember_commission(user_id, commission_id)
 
-    # Get month total after adding this commission
-    month_commissions = db.get_commissions(user_id, month, year)
-    month_total = sum(Decimal(c["amount"]) for c in month_commissions)
-    month_split_user = sum(Decimal(c["split_user"]) for c in month_commissions)
-    month_split_partner = sum(Decimal(c["split_partner"]) for c in month_commissions)
+    # Month total including this commission, without re-querying
+    month_total = month_totals["total_commission"] + amount
+    month_split_user = month_totals["split_user"] + split_user
+    month_split_partner = month_totals["split_partner"] + split_partner
 
     # Send confirmation
-    response = "✅ Commission added!\n\n"
-    response += f"💰 Amount: {format_kes(amount)}\n"
-    response += f"👤 Your Share: {format_kes(split_user)}\n"
-    response += f"🤝 Partner Share: {format_kes(split_partner)}\n"
+    timestamp = get_current_time().strftime("%Y-%m-%d %H:%M:%S")
+    parts = [
+        "✅ Commission added!\n\n",
+        f"💰 Amount: {format_kes(amount)}\n",
+        f"👤 Your Share: {format_kes(split_user)}\n",
+        f"🤝 Partner Share: {format_kes(split_partner)}\n",
+    ]
     if note:
-        response += f"📝 Note: {note}\n"
-    response += f"\n📊 **Month Total ({month}):**\n"
-    response += f"💰 Total: {format_kes(month_total)}\n"  # type: ignore
-    response += f"👤 Your Total: {format_kes(month_split_user)}\n"  # type: ignore
-    response += f"🤝 Partner Total: {format_kes(month_split_partner)}\n"  # type: ignore  # type: ignore
-    response += f"\n📅 Month: {month}\n"
-    response += f"⏰ {get_current_time().strftime('%Y-%m-%d %H:%M:%S')}"
+        parts.append(f"📝 Note: {note}\n")
+    parts.extend(
+        [
+            f"\n📊 **Month Total ({month}):**\n",
+            f"💰 Total: {format_kes(month_total)}\n",
+            f"👤 Your Total: {format_kes(month_split_user)}\n",
+            f"🤝 Partner Total: {format_kes(month_split_partner)}\n",
+            f"\n📅 Month: {month}\n",
+            f"⏰ {timestamp}",
+        ]
+    )
+    response = "".join(parts)
 
     await update.message.reply_text(response, parse_mode="Markdown")
 
@@ -349,14 +465,12 @@ async def handle_yes_no(update: Update, context: ContextTypes.DEFAULT_TYPE):
         month = pending["month"]
         year = pending["year"]
 
-        if is_solo:
-            split_user = amount
-            split_partner = Decimal("0")
-        else:
-            split_user = amount * Decimal(str(config.DEFAULT_SPLIT_USER))
-            split_partner = amount * Decimal(str(config.DEFAULT_SPLIT_PARTNER))
+        split_user, split_partner = split_commission(amount, is_solo)
+
+        month_totals = await _db(db.get_monthly_totals, user_id, month, year)
 
-        commission_id = db.add_commission(
+        commission_id = await _db(
+            db.add_commission,
             user_id=user_id,
             amount=amount,
             note=note or "",
@@ -366,28 +480,27 @@ async def handle_yes_no(update: Update, context: ContextTypes.DEFAULT_TYPE):
             split_partner=split_partner,
         )
 
-        last_commissions[user_id] = {
-            "commission_id": commission_id,
-            "timestamp": get_current_time(),
-        }
+        remember_commission(user_id, commission_id)
 
-        # Get month total after adding this commission
-        month_commissions = db.get_commissions(user_id, month, year)
-        month_total = sum(Decimal(c["amount"]) for c in month_commissions)
-        month_split_user = sum(Decimal(c["split_user"]) for c in month_commissions)
-        month_split_partner = sum(
-            Decimal(c["split_partner"]) for c in month_commissions
-        )
+        # Month total including this commission, without re-querying
+        month_total = month_totals["total_commission"] + amount
+        month_split_user = month_totals["split_user"] + split_user
+        month_split_partner = month_totals["split_partner"] + split_partner
 
-        response = f"✅ Commission added to {month}!\n\n"
-        response += f"💰 Amount: {format_kes(amount)}\n"
-        response += f"👤 Your Share: {format_kes(split_user)}\n"
-        response += f"🤝 Partner Share: {format_kes(split_partner)}\n"
-        response += f"\n📊 **Month Total ({month}):**\n"
-        response += f"💰 Total: {format_kes(month_total)}\n"  # type: ignore
-        response += f"👤 Your Total: {format_kes(month_split_user)}\n"  # type: ignore
-        response += f"🤝 Partner Total: {format_kes(month_split_partner)}\n"  # type: ignore
-        response += f"\n⏰ {get_current_time().strftime('%Y-%m-%d %H:%M:%S')}"
+        timestamp = get_current_time().strftime("%Y-%m-%d %H:%M:%S")
+        response = "".join(
+            [
+                f"✅ Commission added to {month}!\n\n",
+                f"💰 Amount: {format_kes(amount)}\n",
+                f"👤 Your Share: {format_kes(split_user)}\n",
+                f"🤝 Partner Share: {format_kes(split_partner)}\n",
+                f"\n📊 **Month Total ({month}):**\n",
+                f"💰 Total: {format_kes(month_total)}\n",
+                f"👤 Your Total: {format_kes(month_split_user)}\n",
+                f"🤝 Partner Total: {format_kes(month_split_partner)}\n",
+                f"\n⏰ {timestamp}",
+            ]
+        )
 
         await update.message.reply_text(response, parse_mode="Markdown")
         del context.user_data["pending_commission"]
@@ -410,20 +523,24 @@ async def dashboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     month, year = get_current_month_year(user_id)
 
-    commissions = db.get_commissions(user_id, month, year)
-    payouts = db.get_payouts(user_id, month, year)
+    totals = await _db(db.get_monthly_totals, user_id, month, year)
+    payouts = await _db(db.get_payouts, user_id, month, year)
 
-    stats = calculate_monthly_stats(commissions, payouts)
-
-    response = f"📊 **Dashboard - {month}**\n\n"
-    response += f"💰 Total Commission: {format_kes(stats['total_commission'])}\n"
-    response += f"👤 Your Share: {format_kes(stats['split_user'])}\n"
-    response += f"🤝 Partner Share: {format_kes(stats['split_partner'])}\n"
-    response += f"📝 Entries: {stats['entries_count']}\n"
+    parts = [
+        f"📊 **Dashboard - {month}**\n\n",
+        f"💰 Total Commission: {format_kes(totals['total_commission'])}\n",
+        f"👤 Your Share: {format_kes(totals['split_user'])}\n",
+        f"🤝 Partner Share: {format_kes(totals['split_partner'])}\n",
+        f"📝 Entries: {totals['entries_count']}\n",
+    ]
 
     if payouts:
-        response += f"💸 Payouts Made: {format_kes(stats['total_payouts'])}\n"
-        response += f"💵 Owed to Partner: {format_kes(stats['owed_to_partner'])}\n"
+        total_payouts = sum(p["amount"] for p in payouts)
+        owed_to_partner = totals["split_partner"] - total_payouts
+        parts.append(f"💸 Payouts Made: {format_kes(total_payouts)}\n")
+        parts.append(f"💵 Owed to Partner: {format_kes(owed_to_partner)}\n")
+
+    response = "".join(parts)
 
     if hasattr(message, "reply_text"):
         await message.reply_text(response, parse_mode="Markdown")  # type: ignore
@@ -443,8 +560,8 @@ async def balance(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     month, year = get_current_month_year(user_id)
 
-    commissions = db.get_commissions(user_id, month, year)
-    payouts = db.get_payouts(user_id, month, year)
+    commissions = await _db(db.get_commissions, user_id, month, year)
+    payouts = await _db(db.get_payouts, user_id, month, year)
 
     stats = calculate_monthly_stats(commissions, payouts)
 
@@ -458,55 +575,60 @@ async def balance(update: Update, context: ContextTypes.DEFAULT_TYPE):
     month_name = month_names.get(month_num, month)
     formatted_month = f"{month_name} {year}"
 
-    response = "💰 **Balance Summary**\n"
     # Separator line matching the length of "Balance Summary"
     separator_length = len("Balance Summary")
-    response += "━" * separator_length + "\n"
-    response += f"📅 {formatted_month}\n\n"
-    response += "**BALANCES**\n"
-    response += f"💵 Total:             {format_kes(stats['total_commission'])}\n"
-    response += f"👤 Your Share:        {format_kes(stats['split_user'])}\n"
-    response += f"🤝 Partner Share:     {format_kes(stats['split_partner'])}\n\n"
+    parts = [
+        "💰 **Balance Summary**\n",
+        "━" * separator_length + "\n",
+        f"📅 {formatted_month}\n\n",
+        "**BALANCES**\n",
+        f"💵 Total:             {format_kes(stats['total_commission'])}\n",
+        f"👤 Your Share:        {format_kes(stats['split_user'])}\n",
+        f"🤝 Partner Share:     {format_kes(stats['split_partner'])}\n\n",
+    ]
 
     # Performance section
+    parts.append("📊 **Performance**\n")
     if stats['entries_count'] > 0:
-        response += "📊 **Performance**\n"
-        response += f"   Entries: {stats['entries_count']} | Avg: {format_kes(stats['average_per_entry'])}\n"
-        
+        parts.append(
+            f"   Entries: {stats['entries_count']} | Avg: {format_kes(stats['average_per_entry'])}\n"
+        )
+
         if stats['largest_entry']:
-            largest_amount = format_kes(Decimal(stats['largest_entry']['amount']))
-            response += f"   Largest: {largest_amount}"
+            largest_amount = format_kes(stats['largest_entry']['amount'])
+            parts.append(f"   Largest: {largest_amount}")
         else:
-            response += "   Largest: KES 0.00"
-        
+            parts.append("   Largest: KES 0.00")
+
         if stats['smallest_entry']:
-            smallest_amount = format_kes(Decimal(stats['smallest_entry']['amount']))
-            response += f" | Smallest: {smallest_amount}\n"
+            smallest_amount = format_kes(stats['smallest_entry']['amount'])
+            parts.append(f" | Smallest: {smallest_amount}\n")
         else:
-            response += " | Smallest: KES 0.00\n"
-        
-        response += "\n"
+            parts.append(" | Smallest: KES 0.00\n")
+
+        parts.append("\n")
     else:
-        response += "📊 **Performance**\n"
-        response += "   Entries: 0 | Avg: KES 0.00\n"
-        response += "   Largest: KES 0.00 | Smallest: KES 0.00\n\n"
+        parts.append("   Entries: 0 | Avg: KES 0.00\n")
+        parts.append("   Largest: KES 0.00 | Smallest: KES 0.00\n\n")
 
     # Activity section
-    response += f"📅 **Activity:** {stats['days_active']} active days, {stats['days_inactive']} inactive\n\n"
+    parts.append(
+        f"📅 **Activity:** {stats['days_active']} active days, {stats['days_inactive']} inactive\n\n"
+    )
 
     # Top 3 Weeks section
     if stats.get('weekly_totals') and len(stats['weekly_totals']) > 0:
-        # Sort weekly totals by amount (descending) and get top 3
-        weekly_items = sorted(
-            stats['weekly_totals'].items(),
-            key=lambda x: x[1],
-            reverse=True
-        )[:3]
+        # Top 3 weekly totals by amount (descending)
+        weekly_items = heapq.nlargest(
+            3, stats['weekly_totals'].items(), key=lambda x: x[1]
+        )
         
         if weekly_items:
-            response += "🏆 **Top 3 Weeks**\n"
+            parts.append("🏆 **Top 3 Weeks**\n")
             for i, (week, total) in enumerate(weekly_items, 1):
-                response += f"   {i}. {week}: {format_kes(total)}\n"
+                parts.append(f"   {i}. {week}: {format_kes(total)}\n")
+
+    response = "".join(parts)
 
     if hasattr(message, "reply_text"):
         await message.reply_text(response, parse_mode="Markdown")  # type: ignore
@@ -525,19 +647,22 @@ async def paid(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not context.args or len(context.args) == 0:
         # Show help with list of closed months
         current_month, current_year = get_current_month_year(user_id)
-        closed_months = db.get_all_monthly_summaries(user_id)
+        closed_months = await _db(db.get_all_monthly_summaries, user_id)
 
-        response = "❌ Usage: `/paid <amount> [month]`\n\n"
-        response += "**Examples:**\n"
-        response += "• `/paid 5000` - Record payout for current month\n"
-        response += "• `/paid 5000 2025-12` - Record payout for December 2025\n\n"
+        parts = [
+            "❌ Usage: `/paid <amount> [month]`\n\n",
+            "**Examples:**\n",
+            "• `/paid 5000` - Record payout for current month\n",
+            "• `/paid 5000 2025-12` - Record payout for December 2025\n\n",
+        ]
 
         if closed_months:
-            response += "**Closed Months Available:**\n"
+            parts.append("**Closed Months Available:**\n")
             for summary in closed_months[:5]:  # Show last 5 closed months
                 month_key = f"{summary['year']}-{summary['month']}"
-                response += f"• {month_key} (Statement: {summary['statement_id']})\n"
+                parts.append(f"• {month_key} (Statement: {summary['statement_id']})\n")
 
+        response = "".join(parts)
         await update.message.reply_text(response, parse_mode="Markdown")
         return
 
@@ -557,7 +682,7 @@ async def paid(update: Update, context: ContextTypes.DEFAULT_TYPE):
         month, year = parse_month_year(month_str)
 
         # Check if month is closed
-        monthly_summary = db.get_monthly_summary(user_id, month, year)
+        monthly_summary = await _db(db.get_monthly_summary, user_id, month, year)
         if not monthly_summary:
             # Month not closed, check if it's the current month
             current_month, current_year = get_current_month_year(user_id)
@@ -573,25 +698,34 @@ async def paid(update: Update, context: ContextTypes.DEFAULT_TYPE):
         month, year = get_current_month_year(user_id)
 
     # Record the payout
-    db.add_payout(user_id, amount, month, year)
+    await _db(db.add_payout, user_id, amount, month, year)
 
-    # Get updated stats
-    commissions = db.get_commissions(user_id, month, year)
-    payouts = db.get_payouts(user_id, month, year)
-    stats = calculate_monthly_stats(commissions, payouts)
+    # Get updated totals
+    totals = await _db(db.get_monthly_totals, user_id, month, year)
+    payouts = await _db(db.get_payouts, user_id, month, year)
+    total_payouts = sum((p["amount"] for p in payouts), _ZERO)
+    owed_to_partner = totals["split_partner"] - total_payouts
 
-    monthly_summary = db.get_monthly_summary(user_id, month, year)
+    monthly_summary = await _db(db.get_monthly_summary, user_id, month, year)
     is_closed = monthly_summary is not None
 
-    response = "✅ Payout recorded!\n\n"
-    response += f"💰 Amount: {format_kes(amount)}\n"
-    response += f"📅 Month: {month}"
+    timestamp = get_current_time().strftime("%Y-%m-%d %H:%M:%S")
+    parts = [
+        "✅ Payout recorded!\n\n",
+        f"💰 Amount: {format_kes(amount)}\n",
+        f"📅 Month: {month}",
+    ]
     if is_closed:
-        response += f" (Closed - {monthly_summary['statement_id']})"
-    response += "\n\n"
-    response += f"💸 Total Payouts for {month}: {format_kes(stats['total_payouts'])}\n"
-    response += f"💵 Remaining Owed: {format_kes(stats['owed_to_partner'])}\n"
-    response += f"\n⏰ {get_current_time().strftime('%Y-%m-%d %H:%M:%S')}"
+        parts.append(f" (Closed - {monthly_summary['statement_id']})")
+    parts.extend(
+        [
+            "\n\n",
+            f"💸 Total Payouts for {month}: {format_kes(total_payouts)}\n",
+            f"💵 Remaining Owed: {format_kes(owed_to_partner)}\n",
+            f"\n⏰ {timestamp}",
+        ]
+    )
+    response = "".join(parts)
 
     await update.message.reply_text(response, parse_mode="Markdown")
 
@@ -611,7 +745,7 @@ async def undo(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     last_comm = last_commissions[user_id]
-    time_diff = (get_current_time() - last_comm["timestamp"]).total_seconds() / 60
+    time_diff = (time.monotonic() - last_comm["timestamp"]) / 60
 
     if time_diff > config.UNDO_WINDOW_MINUTES:
         await update.message.reply_text(
@@ -621,7 +755,7 @@ async def undo(update: Update, context: ContextTypes.DEFAULT_TYPE):
         del last_commissions[user_id]
         return
 
-    success = db.delete_commission(last_comm["commission_id"], user_id)
+    success = await _db(db.delete_commission, last_comm["commission_id"], user_id)
     if success:
         await update.message.reply_text("✅ Last commission entry undone!")
         del last_commissions[user_id]
@@ -652,25 +786,13 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         else:
             year = get_current_time().year
 
-        monthly_summaries = db.get_all_monthly_summaries(user_id, year)
-
-        # Get all commissions for the year (even if months aren't closed)
-        # First get from closed months
-        all_commissions = []
-        for summary in monthly_summaries:
-            comms = db.get_commissions(user_id, summary["month"], summary["year"])
-            all_commissions.extend(comms)
+        monthly_summaries = await _db(db.get_all_monthly_summaries, user_id, year)
 
-        # Also get commissions for all months of the year (including open months)
-        # We need to get all commissions and filter by year
-        all_user_commissions = db.get_commissions(user_id)
-        year_commissions = [c for c in all_user_commissions if c.get("year") == year]
+        # Entry counts and weeks cover all months of the year (even if not closed)
+        month_aggregates = await _db(db.get_yearly_month_aggregates, user_id, year)
+        daily_totals = await _db(db.get_yearly_daily_totals, user_id, year)
 
-        # Use year_commissions if we have them, otherwise use all_commissions
-        if year_commissions:
-            all_commissions = year_commissions
-
-        stats = calculate_yearly_stats(monthly_summaries, all_commissions)
+        stats = calculate_yearly_stats(monthly_summaries, month_aggregates, daily_totals)
         formatted = format_yearly_stats(stats)
     else:
         # Monthly stats (default)
@@ -691,8 +813,8 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         else:
             month, year = get_current_month_year(user_id)
 
-        commissions = db.get_commissions(user_id, month, year)
-        payouts = db.get_payouts(user_id, month, year)
+        commissions = await _db(db.get_commissions, user_id, month, year)
+        payouts = await _db(db.get_payouts, user_id, month, year)
 
         stats = calculate_monthly_stats(commissions, payouts)
         formatted = format_monthly_stats(stats)
@@ -719,13 +841,16 @@ async def yearly(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         year = get_current_time().year
 
-    monthly_summaries = db.get_all_monthly_summaries(user_id, year)
-    all_commissions = []
-    for summary in monthly_summaries:
-        comms = db.get_commissions(user_id, summary["month"], summary["year"])
-        all_commissions.extend(comms)
+    monthly_summaries = await _db(db.get_all_monthly_summaries, user_id, year)
+
+    # Only closed months count towards the yearly summary
+    closed_months = {summary["month"] for summary in monthly_summaries}
+    month_aggregates = await _db(db.get_yearly_month_aggregates, user_id, year)
+    month_aggregates = [m for m in month_aggregates if m["month"] in closed_months]
+    daily_totals = await _db(db.get_yearly_daily_totals, user_id, year)
+    daily_totals = [d for d in daily_totals if d["month"] in closed_months]
 
-    stats = calculate_yearly_stats(monthly_summaries, all_commissions)
+    stats = calculate_yearly_stats(monthly_summaries, month_aggregates, daily_totals)
     formatted = format_yearly_stats(stats)
 
     await update.message.reply_text(formatted, parse_mode="Markdown")
@@ -743,8 +868,6 @@ async def export_csv(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     user_id = update.effective_user.id
-    import csv
-    import io
 
     month: str | None = None
     year: int
@@ -754,49 +877,50 @@ async def export_csv(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if len(arg) == 4 and arg.isdigit():
             # Year export
             year = int(arg)
-            monthly_summaries = db.get_all_monthly_summaries(user_id, year)
-            commissions = []
-            for summary in monthly_summaries:
-                comms = db.get_commissions(user_id, summary["month"], summary["year"])
-                commissions.extend(comms)
+            monthly_summaries = await _db(db.get_all_monthly_summaries, user_id, year)
+            # Only closed months are exported
+            closed_months = {summary["month"] for summary in monthly_summaries}
+            commissions = await _db(db.get_commissions_by_year, user_id, year)
+            commissions = [c for c in commissions if c["month"] in closed_months]
         else:
             # Month export
             month, year = parse_month_year(arg)
-            commissions = db.get_commissions(user_id, month, year)
+            commissions = await _db(db.get_commissions, user_id, month, year)
     else:
         # Current month
         month, year = get_current_month_year(user_id)
-        commissions = db.get_commissions(user_id, month, year)
+        commissions = await _db(db.get_commissions, user_id, month, year)
 
     if not commissions:
         if hasattr(message, "reply_text"):
             await message.reply_text("❌ No data to export.")  # type: ignore
         return
 
-    # Create CSV
-    output = io.StringIO()
+    # Create CSV, encoding rows straight into a single bytes buffer
+    buffer = io.BytesIO()
+    output = io.TextIOWrapper(buffer, encoding="utf-8", newline="")
     writer = csv.writer(output)
     writer.writerow(["Date", "Amount", "Your Share", "Partner Share", "Note"])
-
-    for comm in commissions:
-        writer.writerow(
-            [
-                comm["date_added"],
-                comm["amount"],
-                comm["split_user"],
-                comm["split_partner"],
-                comm["note"] or "",
-            ]
-        )
-
-    csv_data = output.getvalue()
-    output.close()
+    writer.writerows(
+        [
+            comm["date_added"],
+            comm["amount"],
+            comm["split_user"],
+            comm["split_partner"],
+            comm["note"] or "",
+        ]
+        for comm in commissions
+    )
+    output.flush()
+    # Detach so closing the wrapper doesn't close the buffer
+    output.detach()
+    buffer.seek(0)
 
     # Send as document
     filename = f"commissions_{year}_{month if month else 'year'}.csv"
     if hasattr(message, "reply_document"):
         await message.reply_document(  # type: ignore
-            document=io.BytesIO(csv_data.encode("utf-8")), filename=filename
+            document=buffer, filename=filename
         )
 
 
@@ -811,181 +935,225 @@ async def settings(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not await require_authorization(update, context):
         return
 
-    response = "⚙️ **Settings**\n\n"
-    response += f"📅 Timezone: {config.DEFAULT_TIMEZONE}\n"
-    response += (
-        f"⏰ Weekly Summary: Friday {config.WEEKLY_SUMMARY_TIME.strftime('%H:%M')}\n"
-    )
-    response += f"⏰ Month-End Summary: Last day {config.MONTH_END_SUMMARY_TIME.strftime('%H:%M')}\n"
-    response += (
-        f"⏰ Payout Reminder: 28th {config.PAYOUT_REMINDER_TIME.strftime('%H:%M')}\n"
-    )
-    response += f"↩️ Undo Window: {config.UNDO_WINDOW_MINUTES} minutes\n"
-    response += (
-        f"🔍 Duplicate Detection: {config.DUPLICATE_DETECTION_MINUTES} minutes\n"
+    response = "".join(
+        [
+            "⚙️ **Settings**\n\n",
+            f"📅 Timezone: {config.DEFAULT_TIMEZONE}\n",
+            f"⏰ Weekly Summary: Friday {config.WEEKLY_SUMMARY_TIME.strftime('%H:%M')}\n",
+            f"⏰ Month-End Summary: Last day {config.MONTH_END_SUMMARY_TIME.strftime('%H:%M')}\n",
+            f"⏰ Payout Reminder: 28th {config.PAYOUT_REMINDER_TIME.strftime('%H:%M')}\n",
+            f"↩️ Undo Window: {config.UNDO_WINDOW_MINUTES} minutes\n",
+            f"🔍 Duplicate Detection: {config.DUPLICATE_DETECTION_MINUTES} minutes\n",
+            f"⚠️ Zero Activity Alert: {config.ZERO_ACTIVITY_DAYS} days\n",
+        ]
     )
-    response += f"⚠️ Zero Activity Alert: {config.ZERO_ACTIVITY_DAYS} days\n"
 
     await message.reply_text(response, parse_mode="Markdown")  # type: ignore
 
 
-async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle inline keyboard button presses"""
+async def auth_approve_callback(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, param: str | None
+):
+    """Approve an authorization request from the inline button (owner only)"""
     query = update.callback_query
-    if not query or not update.effective_user:
+    if update.effective_user.id != _OWNER_ID:
+        await query.edit_message_text("❌ Only the bot owner can authorize users.")
         return
 
-    await query.answer()
-
-    # Handle authorization approve/deny buttons (owner only)
-    if query.data and query.data.startswith("auth_"):
-        if not config.OWNER_USER_ID or update.effective_user.id != config.OWNER_USER_ID:
-            await query.edit_message_text("❌ Only the bot owner can authorize users.")
-            return
+    user_id_to_approve = int(param)
+    success = await _db(
+        db.approve_user, user_id_to_approve, update.effective_user.id
+    )
 
-        if query.data.startswith("auth_approve_"):
-            user_id_to_approve = int(query.data.split("_")[2])
-            success = db.approve_user(user_id_to_approve, update.effective_user.id)
-
-            if success:
-                # Notify the approved user
-                try:
-                    await context.bot.send_message(
-                        chat_id=user_id_to_approve,
-                        text="✅ **Authorization Approved!**\n\n"
-                        "You can now use the bot. Send /start to begin!",
-                        parse_mode="Markdown",
-                    )
-                except Exception as e:
-                    logger.error(f"Failed to notify approved user: {e}")
-
-                await query.edit_message_text(
-                    f"✅ User {user_id_to_approve} has been approved and notified."
-                )
-            else:
-                await query.edit_message_text(
-                    "❌ User is already authorized or approval failed."
-                )
+    if success:
+        _authorized_cache.add(user_id_to_approve)
+        _invalidate_users_cache()
 
-        elif query.data.startswith("auth_deny_"):
-            user_id_to_deny = int(query.data.split("_")[2])
-            # Remove from pending
-            conn = db.get_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                "DELETE FROM pending_authorizations WHERE user_id = ?",
-                (user_id_to_deny,),
+        # Notify the approved user
+        try:
+            await context.bot.send_message(
+                chat_id=user_id_to_approve,
+                text="✅ **Authorization Approved!**\n\n"
+                "You can now use the bot. Send /start to begin!",
+                parse_mode="Markdown",
             )
-            conn.commit()
-            conn.close()
+        except Exception as e:
+            logger.error(f"Failed to notify approved user: {e}")
 
-            # Notify the denied user
-            try:
-                await context.bot.send_message(
-                    chat_id=user_id_to_deny,
-                    text="❌ **Authorization Denied**\n\n"
-                    "Your request to use this bot has been denied.",
-                    parse_mode="Markdown",
-                )
-            except Exception as e:
-                logger.error(f"Failed to notify denied user: {e}")
+        await query.edit_message_text(
+            f"✅ User {user_id_to_approve} has been approved and notified."
+        )
+    else:
+        await query.edit_message_text(
+            "❌ User is already authorized or approval failed."
+        )
 
-            await query.edit_message_text(
-                f"❌ User {user_id_to_deny} has been denied and notified."
-            )
 
+async def auth_deny_callback(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, param: str | None
+):
+    """Deny an authorization request from the inline button (owner only)"""
+    query = update.callback_query
+    if update.effective_user.id != _OWNER_ID:
+        await query.edit_message_text("❌ Only the bot owner can authorize users.")
+        return
+
+    user_id_to_deny = int(param)
+    # Remove from pending
+    await _db(db.remove_pending_authorization, user_id_to_deny)
+
+    # Notify the denied user
+    try:
+        await context.bot.send_message(
+            chat_id=user_id_to_deny,
+            text="❌ **Authorization Denied**\n\n"
+            "Your request to use this bot has been denied.",
+            parse_mode="Markdown",
+        )
+    except Exception as e:
+        logger.error(f"Failed to notify denied user: {e}")
+
+    await query.edit_message_text(
+        f"❌ User {user_id_to_deny} has been denied and notified."
+    )
+
+
+# Parameterised callbacks, keyed by the "<prefix>_<action>" part of callback_data
+_CALLBACKS = {
+    "auth_approve": auth_approve_callback,
+    "auth_deny": auth_deny_callback,
+}
+
+
+async def clear_db_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle the clear database confirmation buttons (owner only)"""
+    query = update.callback_query
+    if not query or not update.effective_user:
         return
 
-    # Handle clear database confirmation (owner only)
-    if query.data and query.data.startswith("clear_db_"):
-        if not config.OWNER_USER_ID or update.effective_user.id != config.OWNER_USER_ID:
+    await query.answer()
+
+    if update.effective_user.id != _OWNER_ID:
+        await query.edit_message_text(
+            "❌ Only the bot owner can clear the database."
+        )
+        return
+
+    if query.data == "clear_db_confirm":
+        try:
+            await _db(db.clear_database)
+            _authorized_cache.clear()
+            _invalidate_users_cache()
             await query.edit_message_text(
-                "❌ Only the bot owner can clear the database."
+                "✅ **Database Cleared Successfully**\n\n"
+                "All data has been permanently deleted.\n"
+                "The database schema remains intact.",
+                parse_mode="Markdown",
             )
-            return
+            logger.info(f"Database cleared by user {update.effective_user.id}")
+        except Exception as e:
+            await query.edit_message_text(
+                f"❌ **Error clearing database:**\n\n{str(e)}"
+            )
+            logger.error(f"Failed to clear database: {e}")
+    elif query.data == "clear_db_cancel":
+        await query.edit_message_text("❌ Database clear cancelled.")
 
-        if query.data == "clear_db_confirm":
-            try:
-                db.clear_database()
-                await query.edit_message_text(
-                    "✅ **Database Cleared Successfully**\n\n"
-                    "All data has been permanently deleted.\n"
-                    "The database schema remains intact.",
-                    parse_mode="Markdown",
-                )
-                logger.info(f"Database cleared by user {update.effective_user.id}")
-            except Exception as e:
-                await query.edit_message_text(
-                    f"❌ **Error clearing database:**\n\n{str(e)}"
-                )
-                logger.error(f"Failed to clear database: {e}")
-        elif query.data == "clear_db_cancel":
-            await query.edit_message_text("❌ Database clear cancelled.")
 
+async def _stats_with_args(update: Update, context: ContextTypes.DEFAULT_TYPE, args: list):
+    """Run stats_command with temporarily overridden args"""
+    original_args = context.args
+    context.args = args
+    try:
+        await stats_command(update, context)
+    finally:
+        context.args = original_args
+
+
+# Plain quick-action buttons, keyed by callback_data
+CALLBACK_DISPATCH = {
+    "dashboard": dashboard,
+    "balance": balance,
+    "stats_month": functools.partial(_stats_with_args, args=["month"]),
+    "stats_year": functools.partial(_stats_with_args, args=["year"]),
+    "export": export_csv,
+    "settings": settings,
+}
+
+
+async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle inline keyboard button presses"""
+    query = update.callback_query
+    if not query or not update.effective_user:
         return
 
+    await query.answer()
+
+    # Parameterised callbacks such as "auth_approve_<user_id>"
+    if query.data:
+        parts = query.data.split("_", 2)
+        handler = _CALLBACKS.get("_".join(parts[:2]))
+        if handler:
+            await handler(update, context, parts[2] if len(parts) > 2 else None)
+            return
+
     # Regular button callbacks (require authorization)
     if not await require_authorization(update, context):
         return
 
-    if query.data == "dashboard":
-        await dashboard(update, context)
-    elif query.data == "balance":
-        await balance(update, context)
-    elif query.data == "stats_month":
-        # Temporarily set args for monthly stats
-        original_args = context.args
-        context.args = ["month"]
-        await stats_command(update, context)
-        context.args = original_args
-    elif query.data == "stats_year":
-        # Temporarily set args for yearly stats
-        original_args = context.args
-        context.args = ["year"]
-        await stats_command(update, context)
-        context.args = original_args
-    elif query.data == "export":
-        await export_csv(update, context)
-    elif query.data == "settings":
-        await settings(update, context)
+    handler = CALLBACK_DISPATCH.get(query.data)
+    if handler:
+        await handler(update, context)
 
 
 # Owner Commands
+async def owner_only(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Reply to owner commands sent by anyone other than the owner"""
+    if update.message:
+        await update.message.reply_text("❌ Only the bot owner can use this command.")
+
+
 async def approve_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Approve a user (owner only)"""
     if not update.effective_user or not update.message:
         return
 
-    if not config.OWNER_USER_ID or update.effective_user.id != config.OWNER_USER_ID:
-        await update.message.reply_text("❌ Only the bot owner can use this command.")
-        return
-
     if not context.args or len(context.args) == 0:
         # Show pending requests
-        pending = db.get_pending_authorizations()
+        pending = await _db(db.get_pending_authorizations)
         if not pending:
             await update.message.reply_text("✅ No pending authorization requests.")
             return
 
-        response = "📋 **Pending Authorization Requests:**\n\n"
+        parts = ["📋 **Pending Authorization Requests:**\n\n"]
         for req in pending:
-            response += f"🆔 ID: `{req['user_id']}`\n"
+            parts.append(f"🆔 ID: `{req['user_id']}`\n")
             if req["username"]:
-                response += f"📱 Username: @{req['username']}\n"
+                parts.append(f"📱 Username: @{req['username']}\n")
             if req["full_name"]:
-                response += f"👤 Name: {req['full_name']}\n"
-            response += f"⏰ Requested: {req['requested_at']}\n"
-            response += f"✅ Approve: `/approve {req['user_id']}`\n"
-            response += f"❌ Deny: `/revoke {req['user_id']}`\n\n"
+                parts.append(f"👤 Name: {req['full_name']}\n")
+            parts.extend(
+                [
+                    f"⏰ Requested: {req['requested_at']}\n",
+                    f"✅ Approve: `/approve {req['user_id']}`\n",
+                    f"❌ Deny: `/revoke {req['user_id']}`\n\n",
+                ]
+            )
+        response = "".join(parts)
 
         await update.message.reply_text(response, parse_mode="Markdown")
         return
 
     try:
         user_id_to_approve = int(context.args[0])
-        success = db.approve_user(user_id_to_approve, update.effective_user.id)
+        success = await _db(
+            db.approve_user, user_id_to_approve, update.effective_user.id
+        )
 
         if success:
+            _authorized_cache.add(user_id_to_approve)
+            _invalidate_users_cache()
+
             # Notify the approved user
             try:
                 await context.bot.send_message(
@@ -1015,24 +1183,25 @@ async def revoke_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not update.effective_user or not update.message:
         return
 
-    if not config.OWNER_USER_ID or update.effective_user.id != config.OWNER_USER_ID:
-        await update.message.reply_text("❌ Only the bot owner can use this command.")
-        return
-
     if not context.args or len(context.args) == 0:
         # Show authorized users
-        authorized = db.get_authorized_users()
+        authorized = await _db(db.get_authorized_users)
         if not authorized:
             await update.message.reply_text("✅ No authorized users.")
             return
 
-        response = "👥 **Authorized Users:**\n\n"
+        parts = ["👥 **Authorized Users:**\n\n"]
         for user in authorized:
-            response += f"🆔 ID: `{user['user_id']}`\n"
+            parts.append(f"🆔 ID: `{user['user_id']}`\n")
             if user.get("name"):
-                response += f"👤 Name: {user['name']}\n"
-            response += f"⏰ Authorized: {user['authorized_at']}\n"
-            response += f"❌ Revoke: `/revoke {user['user_id']}`\n\n"
+                parts.append(f"👤 Name: {user['name']}\n")
+            parts.extend(
+                [
+                    f"⏰ Authorized: {user['authorized_at']}\n",
+                    f"❌ Revoke: `/revoke {user['user_id']}`\n\n",
+                ]
+            )
+        response = "".join(parts)
 
         await update.message.reply_text(response, parse_mode="Markdown")
         return
@@ -1041,11 +1210,13 @@ async def revoke_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id_to_revoke = int(context.args[0])
 
         # Don't allow revoking owner
-        if user_id_to_revoke == config.OWNER_USER_ID:
+        if user_id_to_revoke == _OWNER_ID:
             await update.message.reply_text("❌ Cannot revoke the bot owner.")
             return
 
-        success = db.revoke_user(user_id_to_revoke)
+        success = await _db(db.revoke_user, user_id_to_revoke)
+        _authorized_cache.discard(user_id_to_revoke)
+        _invalidate_users_cache()
 
         if success:
             # Notify the revoked user
@@ -1077,19 +1248,7 @@ async def clear_db(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not update.effective_user or not update.message:
         return
 
-    if not config.OWNER_USER_ID or update.effective_user.id != config.OWNER_USER_ID:
-        await update.message.reply_text("❌ Only the bot owner can use this command.")
-        return
-
     # Show confirmation with inline buttons
-    keyboard = [
-        [
-            InlineKeyboardButton("✅ Confirm Clear", callback_data="clear_db_confirm"),
-            InlineKeyboardButton("❌ Cancel", callback_data="clear_db_cancel"),
-        ]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-
     await update.message.reply_text(
         "⚠️ **WARNING: Clear Database**\n\n"
         "This will **PERMANENTLY DELETE** all data:\n"
@@ -1100,195 +1259,218 @@ async def clear_db(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "• All users and authorizations\n\n"
         "⚠️ **This action cannot be undone!**\n\n"
         "Are you sure you want to proceed?",
-        reply_markup=reply_markup,
+        reply_markup=CLEAR_DB_MARKUP,
         parse_mode="Markdown",
     )
 
 
 # Scheduler Tasks
+async def _broadcast(app: Application, messages: list[tuple[int, str]], description: str):
+    """Send (user_id, text) messages concurrently, at most BROADCAST_CONCURRENCY at a time"""
+    semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+
+    async def send_one(user_id: int, text: str):
+        async with semaphore:
+            await app.bot.send_message(chat_id=user_id, text=text, parse_mode="Markdown")
+
+    results = await asyncio.gather(
+        *(send_one(user_id, text) for user_id, text in messages),
+        return_exceptions=True,
+    )
+    for (user_id, _), result in zip(messages, results):
+        if isinstance(result, Exception):
+            logger.error(f"Failed to send {description} to {user_id}: {result}")
+
+
 async def send_weekly_summary(context):
     """Send weekly summary every Friday"""
     app = context.job.data
-    users = db.get_all_users()
+    users = await _cached_users()
 
     # Only send to authorized users
-    users = [u for u in users if check_authorization(u["user_id"])]
+    auth_ids = _get_authorized_ids()
+    users = [u for u in users if u["user_id"] in auth_ids]
+    timestamp = get_current_time().strftime("%Y-%m-%d %H:%M:%S")
+    # All users share the configured timezone, so the month is the same for everyone
+    month, year = get_current_month_year()
+    messages = []
 
     for user in users:
         user_id = user["user_id"]
-        month, year = get_current_month_year(user_id)
-        commissions = db.get_commissions(user_id, month, year)
-        payouts = db.get_payouts(user_id, month, year)
+        stats = await _db(db.get_monthly_stats, user_id, month, year)
+
+        parts = [
+            f"📊 **Weekly Summary - {month}**\n\n",
+            f"💰 Month-to-Date: {format_kes(stats['total_commission'])}\n",
+            f"👤 Your Share: {format_kes(stats['split_user'])}\n",
+            f"🤝 Partner Share: {format_kes(stats['split_partner'])}\n",
+            f"📝 Entries This Month: {stats['entries_count']}\n",
+            f"📅 Active Days: {stats['days_active']}\n",
+            f"\n⏰ {timestamp}",
+        ]
+        message = "".join(parts)
 
-        stats = calculate_monthly_stats(commissions, payouts)
+        messages.append((user_id, message))
 
-        message = f"📊 **Weekly Summary - {month}**\n\n"
-        message += f"💰 Month-to-Date: {format_kes(stats['total_commission'])}\n"
-        message += f"👤 Your Share: {format_kes(stats['split_user'])}\n"
-        message += f"🤝 Partner Share: {format_kes(stats['split_partner'])}\n"
-        message += f"📝 Entries This Month: {stats['entries_count']}\n"
-        message += f"📅 Active Days: {stats['days_active']}\n"
-        message += f"\n⏰ {get_current_time().strftime('%Y-%m-%d %H:%M:%S')}"
-
-        try:
-            await app.bot.send_message(
-                chat_id=user_id, text=message, parse_mode="Markdown"
-            )
-        except Exception as e:
-            logger.error(f"Failed to send weekly summary to {user_id}: {e}")
+    await _broadcast(app, messages, "weekly summary")
 
 
 async def send_month_end_summary(context):
     """Send month-end summary on last day at 23:00"""
     app = context.job.data
-    users = db.get_all_users()
+    users = await _cached_users()
 
     # Only send to authorized users
-    users = [u for u in users if check_authorization(u["user_id"])]
+    auth_ids = _get_authorized_ids()
+    users = [u for u in users if u["user_id"] in auth_ids]
+    timestamp = get_current_time().strftime("%Y-%m-%d %H:%M:%S")
+    # All users share the configured timezone, so the month is the same for everyone
+    month, year = get_current_month_year()
+    messages = []
+
+    # Close the month for everyone in one transaction
+    statement_ids = await _db(
+        db.close_month_bulk, [u["user_id"] for u in users], month, year
+    )
 
     for user in users:
         user_id = user["user_id"]
-        month, year = get_current_month_year(user_id)
+        statement_id = statement_ids[user_id]
 
-        # Close the month
-        statement_id = db.close_month(user_id, month, year)
+        stats = await _db(db.get_monthly_stats, user_id, month, year)
 
-        commissions = db.get_commissions(user_id, month, year)
-        payouts = db.get_payouts(user_id, month, year)
-        stats = calculate_monthly_stats(commissions, payouts)
+        parts = [
+            f"📋 **Month-End Statement - {month}**\n\n",
+            f"🆔 Statement ID: `{statement_id}`\n\n",
+            f"💰 Total Commission: {format_kes(stats['total_commission'])}\n",
+            f"👤 Your Share: {format_kes(stats['split_user'])}\n",
+            f"🤝 Partner Share: {format_kes(stats['split_partner'])}\n",
+            f"📝 Total Entries: {stats['entries_count']}\n",
+        ]
+        if stats["payouts_count"]:
+            parts.extend(
+                [
+                    f"💸 Payouts Made: {format_kes(stats['total_payouts'])}\n",
+                    f"💵 Owed to Partner: {format_kes(stats['owed_to_partner'])}\n",
+                ]
+            )
+        parts.extend(
+            [
+                f"\n⏰ {timestamp}\n",
+                "\n✅ Month closed and locked.",
+            ]
+        )
+        message = "".join(parts)
 
-        message = f"📋 **Month-End Statement - {month}**\n\n"
-        message += f"🆔 Statement ID: `{statement_id}`\n\n"
-        message += f"💰 Total Commission: {format_kes(stats['total_commission'])}\n"
-        message += f"👤 Your Share: {format_kes(stats['split_user'])}\n"
-        message += f"🤝 Partner Share: {format_kes(stats['split_partner'])}\n"
-        message += f"📝 Total Entries: {stats['entries_count']}\n"
-        if payouts:
-            message += f"💸 Payouts Made: {format_kes(stats['total_payouts'])}\n"
-            message += f"💵 Owed to Partner: {format_kes(stats['owed_to_partner'])}\n"
-        message += f"\n⏰ {get_current_time().strftime('%Y-%m-%d %H:%M:%S')}\n"
-        message += "\n✅ Month closed and locked."
+        messages.append((user_id, message))
 
-        try:
-            await app.bot.send_message(
-                chat_id=user_id, text=message, parse_mode="Markdown"
-            )
-        except Exception as e:
-            logger.error(f"Failed to send month-end summary to {user_id}: {e}")
+    await _broadcast(app, messages, "month-end summary")
 
 
 async def start_new_month(context):
     """Start new month on 1st at 00:00"""
     app = context.job.data
-    users = db.get_all_users()
+    users = await _cached_users()
 
     # Only send to authorized users
-    users = [u for u in users if check_authorization(u["user_id"])]
-
-    for user in users:
-        user_id = user["user_id"]
-        month, year = get_current_month_year(user_id)
-
-        message = "🎉 **New Month Started!**\n\n"
-        message += f"📅 Current Month: {month}\n"
-        message += "💰 Starting Balance: KES 0.00\n"
-        message += "\nReady to track commissions! Just send a number to add an entry.\n"
-        message += f"\n⏰ {get_current_time().strftime('%Y-%m-%d %H:%M:%S')}"
+    auth_ids = _get_authorized_ids()
+    users = [u for u in users if u["user_id"] in auth_ids]
+    timestamp = get_current_time().strftime("%Y-%m-%d %H:%M:%S")
+    # All users share the configured timezone, so the month is the same for everyone
+    month, year = get_current_month_year()
+
+    # The announcement is the same for every user
+    parts = [
+        "🎉 **New Month Started!**\n\n",
+        f"📅 Current Month: {month}\n",
+        "💰 Starting Balance: KES 0.00\n",
+        "\nReady to track commissions! Just send a number to add an entry.\n",
+        f"\n⏰ {timestamp}",
+    ]
+    message = "".join(parts)
+    messages = [(user["user_id"], message) for user in users]
 
-        try:
-            await app.bot.send_message(
-                chat_id=user_id, text=message, parse_mode="Markdown"
-            )
-        except Exception as e:
-            logger.error(f"Failed to send new month notification to {user_id}: {e}")
+    await _broadcast(app, messages, "new month notification")
 
 
 async def send_payout_reminder(context):
     """Send payout reminder on 28th at 18:00"""
     app = context.job.data
-    users = db.get_all_users()
+    users = await _cached_users()
 
     # Only send to authorized users
-    users = [u for u in users if check_authorization(u["user_id"])]
+    auth_ids = _get_authorized_ids()
+    users = [u for u in users if u["user_id"] in auth_ids]
+    timestamp = get_current_time().strftime("%Y-%m-%d %H:%M:%S")
+    # All users share the configured timezone, so the month is the same for everyone
+    month, year = get_current_month_year()
+    messages = []
 
     for user in users:
         user_id = user["user_id"]
-        month, year = get_current_month_year(user_id)
-        commissions = db.get_commissions(user_id, month, year)
-        payouts = db.get_payouts(user_id, month, year)
+        stats = await _db(db.get_monthly_stats, user_id, month, year)
 
-        stats = calculate_monthly_stats(commissions, payouts)
-
-        message = "💵 **Expected Payout Reminder**\n\n"
-        message += f"📅 Month: {month}\n"
-        message += f"🤝 Partner Share: {format_kes(stats['split_partner'])}\n"
-        if payouts:
-            message += f"💸 Payouts Made: {format_kes(stats['total_payouts'])}\n"
-            message += f"💵 **Remaining: {format_kes(stats['owed_to_partner'])}**\n"
+        parts = [
+            "💵 **Expected Payout Reminder**\n\n",
+            f"📅 Month: {month}\n",
+            f"🤝 Partner Share: {format_kes(stats['split_partner'])}\n",
+        ]
+        if stats["payouts_count"]:
+            parts.extend(
+                [
+                    f"💸 Payouts Made: {format_kes(stats['total_payouts'])}\n",
+                    f"💵 **Remaining: {format_kes(stats['owed_to_partner'])}**\n",
+                ]
+            )
         else:
-            message += f"💵 **Total Owed: {format_kes(stats['owed_to_partner'])}**\n"
-        message += f"\n⏰ {get_current_time().strftime('%Y-%m-%d %H:%M:%S')}"
+            parts.append(f"💵 **Total Owed: {format_kes(stats['owed_to_partner'])}**\n")
+        parts.append(f"\n⏰ {timestamp}")
+        message = "".join(parts)
 
-        try:
-            await app.bot.send_message(
-                chat_id=user_id, text=message, parse_mode="Markdown"
-            )
-        except Exception as e:
-            logger.error(f"Failed to send payout reminder to {user_id}: {e}")
+        messages.append((user_id, message))
+
+    await _broadcast(app, messages, "payout reminder")
 
 
 async def check_zero_activity(context):
     """Check for zero activity and alert"""
     app = context.job.data
-    users = db.get_all_users()
+    inactive = await _db(db.users_inactive_since, config.ZERO_ACTIVITY_DAYS)
 
     # Only send to authorized users
-    users = [u for u in users if check_authorization(u["user_id"])]
-
-    for user in users:
-        user_id = user["user_id"]
-        commissions = db.get_commissions(user_id)
+    auth_ids = _get_authorized_ids()
+    inactive = [(user_id, last_added) for user_id, last_added in inactive if user_id in auth_ids]
+    now = get_current_time()
+    messages = []
 
-        if not commissions:
-            continue
-
-        # Get last commission date
-        from dateutil import parser as date_parser
-
-        last_comm = commissions[0]  # Already sorted by date_added DESC
+    for user_id, last_added in inactive:
         try:
-            last_date = date_parser.parse(last_comm["date_added"])
-            if isinstance(last_date, datetime) and not last_date.tzinfo:
-                last_date = pytz.UTC.localize(last_date)
-            
-            # Convert to configured timezone for comparison
-            tz = pytz.timezone(config.DEFAULT_TIMEZONE)
-            if last_date.tzinfo != tz:
-                last_date = last_date.astimezone(tz)
-
-            days_since = (get_current_time() - last_date).days
-
-            if days_since >= config.ZERO_ACTIVITY_DAYS:
-                message = "⚠️ **Zero Activity Alert**\n\n"
-                message += f"No commission entries for {days_since} days.\n"
-                message += f"Last entry: {last_date.strftime('%Y-%m-%d')}\n"
-                message += "\nIs everything okay?"
-
-                try:
-                    await app.bot.send_message(
-                        chat_id=user_id, text=message, parse_mode="Markdown"
-                    )
-                except Exception as e:
-                    logger.error(
-                        f"Failed to send zero activity alert to {user_id}: {e}"
-                    )
+            last_date = datetime.fromisoformat(last_added)
+            if not last_date.tzinfo:
+                last_date = last_date.replace(tzinfo=timezone.utc)
+
+            # Convert to configured timezone for display
+            last_date = last_date.astimezone(_TZ)
+            days_since = (now - last_date).days
+
+            parts = [
+                "⚠️ **Zero Activity Alert**\n\n",
+                f"No commission entries for {days_since} days.\n",
+                f"Last entry: {last_date.strftime('%Y-%m-%d')}\n",
+                "\nIs everything okay?",
+            ]
+            message = "".join(parts)
+
+            messages.append((user_id, message))
         except Exception as e:
             logger.error(f"Error checking zero activity for {user_id}: {e}")
 
+    await _broadcast(app, messages, "zero activity alert")
+
 
 def setup_scheduler(app: Application):
     """Setup scheduled tasks"""
-    tz = pytz.timezone(config.DEFAULT_TIMEZONE)
+    tz = _TZ
     scheduler = AsyncIOScheduler(timezone=tz)
 
     # Create a simple context object for scheduler jobs
@@ -1337,7 +1519,7 @@ def setup_scheduler(app: Application):
     return scheduler
 
 
-async def health_check():
+async def health_check() -> web.AppRunner:
     """Simple HTTP health check server for cloud platforms"""
     app = web.Application()
     
@@ -1352,64 +1534,57 @@ async def health_check():
     site = web.TCPSite(runner, "0.0.0.0", 8000)
     await site.start()
     logger.info("Health check server started on port 8000")
+    return runner
 
 
 async def post_init(application: Application) -> None:
     """Start scheduler after application is initialized"""
+    # Thread pool used by _db() for database calls
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS)
+    )
+
     scheduler = application.bot_data.get("scheduler")
     if scheduler:
         scheduler.start()
         logger.info("Scheduler started")
     
-    # Start health check server
-    asyncio.create_task(health_check())
-    
-    # Set up menu buttons after a short delay to ensure bot is fully initialized
-    await asyncio.sleep(2)  # Wait 2 seconds for bot to fully initialize
+    # Start health check server on PTB's loop; the runner is cleaned up in post_shutdown
+    try:
+        application.bot_data["health_runner"] = await health_check()
+    except OSError as e:
+        logger.warning(f"Could not start health check server: {e}")
 
+    # Set up menu buttons (the bot is already initialized when post_init runs)
     try:
-        commands = [
-            BotCommand("start", "Start the bot and see welcome message"),
-            BotCommand("dashboard", "View current month dashboard"),
-            BotCommand("balance", "Show balance and owed amounts"),
-            BotCommand("paid", "Record payout to partner"),
-            BotCommand("undo", "Undo last commission entry"),
-            BotCommand("stats", "View statistics (month or year)"),
-            BotCommand("yearly", "View yearly summary"),
-            BotCommand("export", "Export CSV data"),
-            BotCommand("settings", "View bot settings"),
-            BotCommand("approve", "Approve user access (owner only)"),
-            BotCommand("revoke", "Revoke user access (owner only)"),
-            BotCommand("clear_db", "Clear all database data (owner only)"),
-        ]
-        await application.bot.set_my_commands(commands)
-        await application.bot.set_chat_menu_button(menu_button=MenuButtonCommands())
+        await application.bot.set_my_commands(BOT_COMMANDS)
+        await application.bot.set_chat_menu_button(menu_button=MENU_BUTTON)
         logger.info("Menu buttons configured")
     except Exception as e:
         logger.warning(f"Could not set menu buttons: {e}")
 
 
+async def post_shutdown(application: Application) -> None:
+    """Stop the health check server and scheduler, then close the database"""
+    runner = application.bot_data.pop("health_runner", None)
+    if runner:
+        await runner.cleanup()
+        logger.info("Health check server stopped")
+
+    # Stop scheduled jobs before the connection they use goes away
+    scheduler = application.bot_data.get("scheduler")
+    if scheduler and scheduler.running:
+        scheduler.shutdown(wait=False)
+
+    db.close()
+
+
 async def setup_menu_buttons(context: ContextTypes.DEFAULT_TYPE) -> None:
     """Set up menu buttons after bot is fully initialized"""
     application = context.application
-    commands = [
-        BotCommand("start", "Start the bot and see welcome message"),
-        BotCommand("dashboard", "View current month dashboard"),
-        BotCommand("balance", "Show balance and owed amounts"),
-        BotCommand("paid", "Record payout to partner"),
-        BotCommand("undo", "Undo last commission entry"),
-        BotCommand("stats", "View statistics (month or year)"),
-        BotCommand("yearly", "View yearly summary"),
-        BotCommand("export", "Export CSV data"),
-        BotCommand("settings", "View bot settings"),
-        BotCommand("approve", "Approve user access (owner only)"),
-        BotCommand("revoke", "Revoke user access (owner only)"),
-        BotCommand("clear_db", "Clear all database data (owner only)"),
-    ]
-
     try:
-        await application.bot.set_my_commands(commands)
-        await application.bot.set_chat_menu_button(menu_button=MenuButtonCommands())
+        await application.bot.set_my_commands(BOT_COMMANDS)
+        await application.bot.set_chat_menu_button(menu_button=MENU_BUTTON)
         logger.info("Menu buttons configured")
     except Exception as e:
         logger.warning(f"Could not set menu buttons: {e}")
@@ -1435,20 +1610,28 @@ def main():
     application.add_handler(CommandHandler("export", export_csv))
     application.add_handler(CommandHandler("settings", settings))
 
-    # Owner-only commands
-    application.add_handler(CommandHandler("approve", approve_user))
-    application.add_handler(CommandHandler("revoke", revoke_user))
-    application.add_handler(CommandHandler("clear_db", clear_db))
+    # Owner-only commands; the owner check happens in the filter, anyone else gets owner_only
+    owner_filter = filters.User(user_id=_OWNER_ID or [])
+    application.add_handler(CommandHandler("approve", approve_user, filters=owner_filter))
+    application.add_handler(CommandHandler("revoke", revoke_user, filters=owner_filter))
+    application.add_handler(CommandHandler("clear_db", clear_db, filters=owner_filter))
+    application.add_handler(CommandHandler(["approve", "revoke", "clear_db"], owner_only))
+
+    # Handle yes/no responses (only acted on while a commission is pending)
+    application.add_handler(MessageHandler(filters.Regex(YES_NO_RE), handle_yes_no))
 
-    # Handle commission messages (numbers)
+    # Handle commission messages (an amount, optionally followed by a note)
     application.add_handler(
-        MessageHandler(filters.TEXT & ~filters.COMMAND, handle_commission_message)
+        MessageHandler(
+            filters.Regex(COMMISSION_MESSAGE_RE) & ~filters.COMMAND,
+            handle_commission_message,
+        )
     )
 
-    # Handle yes/no responses
-    application.add_handler(MessageHandler(filters.Regex("^(yes|no)$"), handle_yes_no))
-
-    # Add callback handler for inline buttons
+    # Add callback handlers for inline buttons; clear_db confirmation is routed first
+    application.add_handler(
+        CallbackQueryHandler(clear_db_callback, pattern=r"^clear_db_")
+    )
     application.add_handler(CallbackQueryHandler(button_callback))
 
     # Setup scheduler and store it in bot_data
@@ -1457,6 +1640,7 @@ def main():
 
     # Add post_init to start scheduler after event loop is running
     application.post_init = post_init
+    application.post_shutdown = post_shutdown
 
     # Start bot
     logger.info("Bot starting...")
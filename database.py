@@ -3,328 +3,563 @@ Database models and operations for Commission Tracker Bot
 """
 
 import sqlite3
-from datetime import datetime, timezone
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 from typing import Optional, List, Dict, Tuple
 from decimal import Decimal
 import config
+from utils import get_current_month_year, generate_statement_id, split_commission
+
+# Money columns hold integer cents. Values are converted at this module's edge:
+# to_cents() on the way in, and the "cents" converter (or from_cents()) on the
+# way out, so callers keep working with Decimal amounts.
+#
+# Stored in PRAGMA user_version. Bump it whenever init_database's DDL or
+# _migrate() changes, otherwise existing databases skip the update.
+SCHEMA_VERSION = 4
+
+
+def to_cents(amount: Decimal) -> int:
+    """Convert an amount already rounded to cents (utils.round_cents) to integer cents"""
+    cents = Decimal(amount).scaleb(2)
+    # Rounding happens once, where amounts come in; refuse to round again here,
+    # or a stored amount could drift a cent from the sum of its shares
+    if cents != cents.to_integral_value():
+        raise ValueError(f"Amount {amount} is not a whole number of cents")
+    return int(cents)
+
+
+def from_cents(cents: int) -> Decimal:
+    """Convert integer cents back to a two-place Decimal"""
+    return Decimal(cents).scaleb(-2)
+
+
+# Columns selected as 'col AS "col [cents]"' come back as Decimal
+sqlite3.register_converter("cents", lambda value: from_cents(int(value)))
+
+# Columns returned by the commission, payout and summary listings. Rows come back
+# as sqlite3.Row, which supports row["column"] without building a dict per row.
+COMMISSION_COLS = (
+    'id, amount AS "amount [cents]", note, date_added, month, year, '
+    'split_user AS "split_user [cents]", split_partner AS "split_partner [cents]", locked'
+)
+PAYOUT_COLS = 'id, amount AS "amount [cents]", date_paid, month, year'
+SUMMARY_COLS = (
+    'id, month, year, user_id, total_commission AS "total_commission [cents]", '
+    'split_user AS "split_user [cents]", split_partner AS "split_partner [cents]", '
+    "statement_id, closed, generated_at"
+)
+
+# SQL for the per-message hot paths. Keeping each statement as one shared string
+# means sqlite3's statement cache (keyed on the SQL text) reuses the compiled
+# statement instead of re-parsing it on every call.
+SQL_IS_AUTHORIZED = "SELECT 1 FROM authorized_users WHERE user_id = ?"
+
+# The upsert always updates so RETURNING yields the existing row too; a stored
+# "User_<id>" placeholder is replaced by the real name once one is known
+SQL_GET_OR_CREATE_USER = """
+    INSERT INTO users (user_id, name) VALUES (?, ?)
+    ON CONFLICT(user_id) DO UPDATE SET
+        name = CASE WHEN name = 'User_' || user_id THEN excluded.name ELSE name END
+    RETURNING user_id, name, timezone, created_at
+"""
+
+SQL_GET_LAST_COMMISSION = f"""
+    SELECT user_id, {COMMISSION_COLS} FROM commissions
+    WHERE user_id = ?
+    ORDER BY date_added DESC
+    LIMIT 1
+"""
+
+# date_added is always UTC isoformat(), so a string comparison orders it by time
+SQL_HAS_RECENT_DUPLICATE = """
+    SELECT EXISTS(
+        SELECT 1 FROM commissions
+        WHERE user_id = ? AND date_added >= ? AND amount = ?
+    )
+"""
+
+SQL_INSERT_COMMISSION = """
+    INSERT INTO commissions
+    (user_id, amount, note, date_added, month, year, split_user, split_partner)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+SQL_INSERT_PAYOUT = """
+    INSERT INTO payouts (user_id, amount, date_paid, month, year)
+    VALUES (?, ?, ?, ?, ?)
+"""
 
+SQL_INSERT_AUDIT = """
+    INSERT INTO audit_logs (action_type, user_id, target_id, after_value, timestamp)
+    VALUES (?, ?, ?, ?, ?)
+"""
+
+SQL_GET_PENDING_AUTHORIZATION_ID = """
+    SELECT id FROM pending_authorizations WHERE user_id = ? ORDER BY id LIMIT 1
+"""
+
+# Inserts only when the user has no pending request yet
+SQL_INSERT_PENDING_AUTHORIZATION = """
+    INSERT INTO pending_authorizations (user_id, username, full_name)
+    SELECT ?, ?, ?
+    WHERE NOT EXISTS (SELECT 1 FROM pending_authorizations WHERE user_id = ?)
+"""
+
+# Re-closing a month updates its summary row in place rather than deleting and
+# re-inserting it as INSERT OR REPLACE would
+SQL_UPSERT_SUMMARY_TAIL = """
+    ON CONFLICT(user_id, month, year) DO UPDATE SET
+        total_commission = excluded.total_commission,
+        split_user = excluded.split_user,
+        split_partner = excluded.split_partner,
+        statement_id = excluded.statement_id,
+        closed = 1,
+        generated_at = excluded.generated_at
+"""
+
+# Empties every table in one transaction and one call. DELETE without a WHERE
+# clause uses SQLite's truncate optimisation; sqlite_sequence resets the
+# auto-increment counters.
+SQL_CLEAR_DATABASE = (
+    "BEGIN IMMEDIATE;\n"
+    + "".join(
+        f"DELETE FROM {table};\n"
+        for table in (
+            "audit_logs",
+            "monthly_summaries",
+            "payouts",
+            "commissions",
+            "pending_authorizations",
+            "authorized_users",
+            "users",
+            "sqlite_sequence",
+        )
+    )
+    + "COMMIT;"
+)
+
+
+def _build_commission_queries() -> Dict[str, str]:
+    """Every shape of the get_commissions query, keyed by filter"""
+    filters = {
+        "all": "",
+        "month": " AND month = ? AND year = ?",
+        "unlocked": " AND locked = 0",
+    }
+    queries = {}
+    for name, where in filters.items():
+        queries[name] = (
+            f"SELECT {COMMISSION_COLS} FROM commissions WHERE user_id = ?{where} "
+            "ORDER BY date_added DESC"
+        )
+    return queries
+
+
+# Built once so each call reuses the same statement text (and cached statement)
+SQL_GET_COMMISSIONS = _build_commission_queries()
+
+SQL_GET_COMMISSIONS_YEAR = (
+    f"SELECT {COMMISSION_COLS} FROM commissions WHERE user_id = ? AND year = ? "
+    "ORDER BY date_added DESC"
+)
+
+SQL_GET_PAYOUTS = f"SELECT {PAYOUT_COLS} FROM payouts WHERE user_id = ? ORDER BY date_paid DESC"
+SQL_GET_PAYOUTS_MONTH = (
+    f"SELECT {PAYOUT_COLS} FROM payouts WHERE user_id = ? AND month = ? AND year = ? "
+    "ORDER BY date_paid DESC"
+)
+
+SQL_GET_MONTHLY_SUMMARY = (
+    f"SELECT {SUMMARY_COLS} FROM monthly_summaries "
+    "WHERE user_id = ? AND month = ? AND year = ?"
+)
+SQL_GET_MONTHLY_SUMMARIES = (
+    f"SELECT {SUMMARY_COLS} FROM monthly_summaries WHERE user_id = ? "
+    "ORDER BY year DESC, month DESC"
+)
+SQL_GET_MONTHLY_SUMMARIES_YEAR = (
+    f"SELECT {SUMMARY_COLS} FROM monthly_summaries WHERE user_id = ? AND year = ? "
+    "ORDER BY year DESC, month DESC"
+)
+
+SQL_GET_PENDING_AUTHORIZATIONS = (
+    "SELECT id, user_id, username, full_name, requested_at FROM pending_authorizations "
+    "ORDER BY requested_at DESC"
+)
+
+def _fetch_dicts(cursor: sqlite3.Cursor) -> List[Dict]:
+    """Fetch the remaining rows as dicts, reading the column names once"""
+    cursor.row_factory = None
+    cols = [d[0] for d in cursor.description]
+    return [dict(zip(cols, row)) for row in cursor.fetchall()]
+
+
+# Comfortably above the number of distinct statements in this module
+STATEMENT_CACHE_SIZE = 128
 
 class Database:
     def __init__(self, db_path: str = None):
         self.db_path = db_path or config.DATABASE_PATH
+        # One connection shared by all threads; the lock serialises access to it.
+        # It stays open for the life of the process, so the page cache and the
+        # prepared statements survive between calls. Queries are short point
+        # lookups, so a pool of reader connections wouldn't buy much.
+        self._conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+            # Wait up to 10s for another process's write lock (busy_timeout)
+            timeout=10,
+            # Transactions are opened explicitly by _transaction()
+            isolation_level=None,
+            # Enables the "cents" converter on aliased money columns
+            detect_types=sqlite3.PARSE_COLNAMES,
+        )
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.RLock()
         self.init_database()
 
     def get_connection(self):
         """Get database connection"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        return conn
+        return self._conn
+
+    def close(self):
+        """Close the shared connection"""
+        with self._lock:
+            # Cheap way to keep planner statistics fresh between schema changes
+            self._conn.execute("PRAGMA optimize")
+            self._conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        """Yield a cursor inside a BEGIN IMMEDIATE transaction, committed on success"""
+        with self._cursor() as cursor:
+            if self._conn.in_transaction:
+                # Already inside a transaction; the outer block commits it
+                yield cursor
+                return
+            # Take the write lock up front so the transaction can't fail part-way
+            # with SQLITE_BUSY when upgrading from a read
+            cursor.execute("BEGIN IMMEDIATE")
+            yield cursor
+            cursor.execute("COMMIT")
+
+    @contextmanager
+    def _cursor(self):
+        """Yield a cursor on the shared connection while holding the lock"""
+        with self._lock:
+            cursor = self._conn.cursor()
+            try:
+                yield cursor
+            except BaseException:
+                # Don't leave a half-done write open for the next caller
+                if self._conn.in_transaction:
+                    self._conn.rollback()
+                raise
+            finally:
+                cursor.close()
 
     def init_database(self):
         """Initialize database schema"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        # Users table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                name TEXT,
-                timezone TEXT DEFAULT 'Africa/Nairobi',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-
-        # Commissions table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS commissions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                amount NUMERIC NOT NULL,
-                note TEXT,
-                date_added TIMESTAMP NOT NULL,
-                month TEXT NOT NULL,
-                year INTEGER NOT NULL,
-                split_user NUMERIC NOT NULL,
-                split_partner NUMERIC NOT NULL,
-                locked BOOLEAN DEFAULT 0,
-                FOREIGN KEY (user_id) REFERENCES users(user_id)
-            )
-        """)
-
-        # Payouts table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS payouts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                amount NUMERIC NOT NULL,
-                date_paid TIMESTAMP NOT NULL,
-                month TEXT NOT NULL,
-                year INTEGER NOT NULL,
-                FOREIGN KEY (user_id) REFERENCES users(user_id)
-            )
-        """)
-
-        # Monthly summaries table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS monthly_summaries (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                month TEXT NOT NULL,
-                year INTEGER NOT NULL,
-                user_id INTEGER NOT NULL,
-                total_commission NUMERIC NOT NULL,
-                split_user NUMERIC NOT NULL,
-                split_partner NUMERIC NOT NULL,
-                statement_id TEXT UNIQUE NOT NULL,
-                closed BOOLEAN DEFAULT 0,
-                generated_at TIMESTAMP NOT NULL,
-                FOREIGN KEY (user_id) REFERENCES users(user_id),
-                UNIQUE(user_id, month, year)
-            )
-        """)
-
-        # Audit logs table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS audit_logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                action_type TEXT NOT NULL,
-                user_id INTEGER NOT NULL,
-                target_id INTEGER,
-                before_value TEXT,
-                after_value TEXT,
-                timestamp TIMESTAMP NOT NULL,
-                FOREIGN KEY (user_id) REFERENCES users(user_id)
-            )
-        """)
-
-        # Authorized users table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS authorized_users (
-                user_id INTEGER PRIMARY KEY,
-                authorized_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                authorized_by INTEGER,
-                FOREIGN KEY (user_id) REFERENCES users(user_id)
-            )
-        """)
-
-        # Pending authorizations table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS pending_authorizations (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                username TEXT,
-                full_name TEXT,
-                requested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(user_id)
-            )
-        """)
-
-        conn.commit()
-        conn.close()
+        with self._cursor() as cursor:
+            # WAL lets reads run alongside writes; NORMAL sync is safe in WAL mode
+            # and avoids an fsync on every commit. Set before creating tables so
+            # a new database starts out in WAL mode.
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute("PRAGMA temp_store=MEMORY")
+            cursor.execute("PRAGMA cache_size=-64000")
+            cursor.execute("PRAGMA mmap_size=268435456")
+
+            # The schema is already current; skip the DDL on warm starts
+            version = cursor.execute("PRAGMA user_version").fetchone()[0]
+            if version >= SCHEMA_VERSION:
+                return
+
+            # Users table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS users (
+                    user_id INTEGER PRIMARY KEY,
+                    name TEXT,
+                    timezone TEXT DEFAULT 'Africa/Nairobi',
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            # Commissions table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS commissions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    amount INTEGER NOT NULL,
+                    note TEXT,
+                    date_added TIMESTAMP NOT NULL,
+                    month TEXT NOT NULL,
+                    year INTEGER NOT NULL,
+                    split_user INTEGER NOT NULL,
+                    split_partner INTEGER NOT NULL,
+                    locked BOOLEAN DEFAULT 0,
+                    FOREIGN KEY (user_id) REFERENCES users(user_id)
+                )
+            """)
+
+            # Payouts table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS payouts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    amount INTEGER NOT NULL,
+                    date_paid TIMESTAMP NOT NULL,
+                    month TEXT NOT NULL,
+                    year INTEGER NOT NULL,
+                    FOREIGN KEY (user_id) REFERENCES users(user_id)
+                )
+            """)
+
+            # Monthly summaries table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS monthly_summaries (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    month TEXT NOT NULL,
+                    year INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    total_commission INTEGER NOT NULL,
+                    split_user INTEGER NOT NULL,
+                    split_partner INTEGER NOT NULL,
+                    statement_id TEXT UNIQUE NOT NULL,
+                    closed BOOLEAN DEFAULT 0,
+                    generated_at TIMESTAMP NOT NULL,
+                    FOREIGN KEY (user_id) REFERENCES users(user_id),
+                    UNIQUE(user_id, month, year)
+                )
+            """)
+
+            # Audit logs table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS audit_logs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    action_type TEXT NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    target_id INTEGER,
+                    before_value TEXT,
+                    after_value TEXT,
+                    timestamp TIMESTAMP NOT NULL,
+                    FOREIGN KEY (user_id) REFERENCES users(user_id)
+                )
+            """)
+
+            # Authorized users table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS authorized_users (
+                    user_id INTEGER PRIMARY KEY,
+                    authorized_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    authorized_by INTEGER,
+                    FOREIGN KEY (user_id) REFERENCES users(user_id)
+                )
+            """)
+
+            # Pending authorizations table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS pending_authorizations (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    username TEXT,
+                    full_name TEXT,
+                    requested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (user_id) REFERENCES users(user_id)
+                )
+            """)
+
+            # Indexes for the per-user month/year lookups. The trailing date column
+            # matches the ORDER BY of the month listings, so they need no sort step;
+            # the (user_id, year) prefix also serves the yearly filters.
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_commissions_uym_date
+                ON commissions(user_id, year, month, date_added DESC)
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_commissions_user_date
+                ON commissions(user_id, date_added DESC)
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_payouts_uym_date
+                ON payouts(user_id, year, month, date_paid DESC)
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_monthly_summaries_uym
+                ON monthly_summaries(user_id, year, month)
+            """)
+
+            # Pending requests are looked up per user on every unauthorized
+            # message, and listed newest first for the owner
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_pending_authorizations_user
+                ON pending_authorizations(user_id)
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_pending_authorizations_requested
+                ON pending_authorizations(requested_at DESC)
+            """)
+
+            # Superseded by the *_date indexes above
+            cursor.execute("DROP INDEX IF EXISTS idx_commissions_uym")
+            cursor.execute("DROP INDEX IF EXISTS idx_payouts_uym")
+            # No query reads it, but every insert and month close paid to maintain it
+            cursor.execute("DROP INDEX IF EXISTS idx_commissions_user_unlocked")
+
+            self._migrate()
+
+            # Refresh planner statistics; the limit keeps this cheap on large tables
+            cursor.execute("PRAGMA analysis_limit=400")
+            cursor.execute("ANALYZE")
+
+    def _migrate(self):
+        """Bring an existing database up to SCHEMA_VERSION"""
+        with self._transaction() as cursor:
+            version = cursor.execute("PRAGMA user_version").fetchone()[0]
+
+            if version < 1:
+                # Money columns used to hold decimal amounts; convert them to cents
+                cursor.execute("""
+                    UPDATE commissions SET
+                        amount = CAST(ROUND(amount * 100) AS INTEGER),
+                        split_user = CAST(ROUND(split_user * 100) AS INTEGER),
+                        split_partner = CAST(ROUND(split_partner * 100) AS INTEGER)
+                """)
+                cursor.execute("""
+                    UPDATE payouts SET amount = CAST(ROUND(amount * 100) AS INTEGER)
+                """)
+                cursor.execute("""
+                    UPDATE monthly_summaries SET
+                        total_commission = CAST(ROUND(total_commission * 100) AS INTEGER),
+                        split_user = CAST(ROUND(split_user * 100) AS INTEGER),
+                        split_partner = CAST(ROUND(split_partner * 100) AS INTEGER)
+                """)
+
+            if version < SCHEMA_VERSION:
+                cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
 
     def get_or_create_user(self, user_id: int, name: str = None) -> Dict:
         """Get or create user"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        cursor.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
-        user = cursor.fetchone()
-
-        if not user:
-            cursor.execute(
-                "INSERT INTO users (user_id, name) VALUES (?, ?)",
-                (user_id, name or f"User_{user_id}"),
-            )
-            conn.commit()
-            cursor.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
+        with self._transaction() as cursor:
+            # RETURNING needs SQLite 3.35+
+            cursor.execute(SQL_GET_OR_CREATE_USER, (user_id, name or f"User_{user_id}"))
             user = cursor.fetchone()
+            return dict(user) if user else None
 
-        conn.close()
-        return dict(user) if user else None
-
-    def get_all_users(self) -> List[Dict]:
+    def get_all_users(self) -> List[sqlite3.Row]:
         """Get all users"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        with self._cursor() as cursor:
+            cursor.execute("SELECT user_id, name FROM users")
+            return cursor.fetchall()
 
-        cursor.execute("SELECT * FROM users")
-        rows = cursor.fetchall()
-        conn.close()
-        return [dict(row) for row in rows]
-
-    def clear_database(self) -> bool:
-        """Clear all data from database (keeps schema)"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        try:
-            # Delete all data from all tables
-            cursor.execute("DELETE FROM audit_logs")
-            cursor.execute("DELETE FROM monthly_summaries")
-            cursor.execute("DELETE FROM payouts")
-            cursor.execute("DELETE FROM commissions")
-            cursor.execute("DELETE FROM pending_authorizations")
-            cursor.execute("DELETE FROM authorized_users")
-            cursor.execute("DELETE FROM users")
-            
-            # Reset auto-increment counters
-            cursor.execute("DELETE FROM sqlite_sequence WHERE name IN ('commissions', 'payouts', 'monthly_summaries', 'audit_logs', 'pending_authorizations')")
-            
-            conn.commit()
-            conn.close()
-            return True
-        except Exception as e:
-            conn.rollback()
-            conn.close()
-            raise e
-
-    def is_authorized(self, user_id: int) -> bool:
-        """Check if user is authorized"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        cursor.execute("SELECT * FROM authorized_users WHERE user_id = ?", (user_id,))
-        result = cursor.fetchone()
-        conn.close()
-        return result is not None
-
-    def add_pending_authorization(self, user_id: int, username: str | None = None, full_name: str | None = None) -> int:
-        """Add pending authorization request"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        # Check if already pending
-        cursor.execute("SELECT * FROM pending_authorizations WHERE user_id = ?", (user_id,))
-        existing = cursor.fetchone()
-
-        if existing:
-            conn.close()
-            return existing['id']
-
-        cursor.execute("""
-            INSERT INTO pending_authorizations (user_id, username, full_name)
-            VALUES (?, ?, ?)
-        """, (user_id, username, full_name))
-
-        request_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return request_id
-
-    def get_pending_authorizations(self) -> List[Dict]:
-        """Get all pending authorization requests"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            SELECT * FROM pending_authorizations 
-            ORDER BY requested_at DESC
-        """)
-        rows = cursor.fetchall()
-        conn.close()
-        return [dict(row) for row in rows]
-
-    def clear_database(self) -> bool:
-        """Clear all data from database (keeps schema)"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        try:
-            # Delete all data from all tables
-            cursor.execute("DELETE FROM audit_logs")
-            cursor.execute("DELETE FROM monthly_summaries")
-            cursor.execute("DELETE FROM payouts")
-            cursor.execute("DELETE FROM commissions")
-            cursor.execute("DELETE FROM pending_authorizations")
-            cursor.execute("DELETE FROM authorized_users")
-            cursor.execute("DELETE FROM users")
-            
-            # Reset auto-increment counters
-            cursor.execute("DELETE FROM sqlite_sequence WHERE name IN ('commissions', 'payouts', 'monthly_summaries', 'audit_logs', 'pending_authorizations')")
-            
-            conn.commit()
-            conn.close()
-            return True
-        except Exception as e:
-            conn.rollback()
-            conn.close()
-            raise e
-
-    def approve_user(self, user_id: int, authorized_by: int) -> bool:
-        """Approve user authorization"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        # Check if already authorized
-        if self.is_authorized(user_id):
-            conn.close()
-            return False
-
-        # Add to authorized users
-        cursor.execute("""
-            INSERT INTO authorized_users (user_id, authorized_by)
-            VALUES (?, ?)
-        """, (user_id, authorized_by))
-
-        # Remove from pending
-        cursor.execute("DELETE FROM pending_authorizations WHERE user_id = ?", (user_id,))
-
-        conn.commit()
-        conn.close()
-        return True
+    def users_inactive_since(self, days: int) -> List[Tuple[int, str]]:
+        """Get (user_id, last date_added) for users with no commission in the last `days` days"""
+        with self._cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT user_id, MAX(date_added) AS last_added
+                FROM commissions
+                GROUP BY user_id
+                HAVING julianday('now') - julianday(MAX(date_added)) >= ?
+            """,
+                (days,),
+            )
 
-    def revoke_user(self, user_id: int) -> bool:
-        """Revoke user authorization"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+            rows = cursor.fetchall()
+            return [(row[0], row[1]) for row in rows]
 
-        cursor.execute("DELETE FROM authorized_users WHERE user_id = ?", (user_id,))
-        deleted = cursor.rowcount > 0
+    def get_monthly_stats(self, user_id: int, month: str, year: int) -> Dict:
+        """Get summary stats for a month (commission totals, activity, payouts) in one query"""
+        with self._cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT COALESCE(SUM(amount), 0), COALESCE(SUM(split_user), 0),
+                       COALESCE(SUM(split_partner), 0), COUNT(*),
+                       COUNT(DISTINCT date(date_added)),
+                       (SELECT COALESCE(SUM(amount), 0) FROM payouts
+                        WHERE user_id = ? AND month = ? AND year = ?),
+                       (SELECT COUNT(*) FROM payouts
+                        WHERE user_id = ? AND month = ? AND year = ?)
+                FROM commissions
+                WHERE user_id = ? AND month = ? AND year = ?
+            """,
+                (user_id, month, year) * 3,
+            )
 
-        conn.commit()
-        conn.close()
-        return deleted
+            (
+                total_commission,
+                split_user,
+                split_partner,
+                entries_count,
+                days_active,
+                total_payouts,
+                payouts_count,
+            ) = cursor.fetchone()
+
+            split_partner = from_cents(split_partner)
+            total_payouts = from_cents(total_payouts)
+            return {
+                "total_commission": from_cents(total_commission),
+                "split_user": from_cents(split_user),
+                "split_partner": split_partner,
+                "entries_count": entries_count,
+                "days_active": days_active,
+                # Same 30-day approximation as stats.calculate_monthly_stats
+                "days_inactive": 30 - days_active,
+                "payouts_count": payouts_count,
+                "total_payouts": total_payouts,
+                "owed_to_partner": split_partner - total_payouts,
+            }
+
+    def get_yearly_month_aggregates(self, user_id: int, year: int) -> List[Dict]:
+        """Get commission totals and entry count per month for a year"""
+        with self._cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT month, SUM(amount), SUM(split_user), SUM(split_partner), COUNT(*)
+                FROM commissions
+                WHERE user_id = ? AND year = ?
+                GROUP BY month
+                ORDER BY month
+            """,
+                (user_id, year),
+            )
 
-    def get_authorized_users(self) -> List[Dict]:
-        """Get all authorized users"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            SELECT au.user_id, au.authorized_at, u.name 
-            FROM authorized_users au
-            LEFT JOIN users u ON au.user_id = u.user_id
-            ORDER BY au.authorized_at DESC
-        """)
-        rows = cursor.fetchall()
-        conn.close()
-        return [dict(row) for row in rows]
+            rows = cursor.fetchall()
+            return [
+                {
+                    "month": month,
+                    "total_commission": from_cents(total_commission),
+                    "split_user": from_cents(split_user),
+                    "split_partner": from_cents(split_partner),
+                    "entries_count": entries_count,
+                }
+                for month, total_commission, split_user, split_partner, entries_count in rows
+            ]
+
+    def get_yearly_daily_totals(self, user_id: int, year: int) -> List[Dict]:
+        """Get commission totals per day (UTC) for a year"""
+        with self._cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT month, date(date_added) AS day, SUM(amount)
+                FROM commissions
+                WHERE user_id = ? AND year = ?
+                GROUP BY month, day
+                ORDER BY day
+            """,
+                (user_id, year),
+            )
 
-    def clear_database(self) -> bool:
-        """Clear all data from database (keeps schema)"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        try:
-            # Delete all data from all tables
-            cursor.execute("DELETE FROM audit_logs")
-            cursor.execute("DELETE FROM monthly_summaries")
-            cursor.execute("DELETE FROM payouts")
-            cursor.execute("DELETE FROM commissions")
-            cursor.execute("DELETE FROM pending_authorizations")
-            cursor.execute("DELETE FROM authorized_users")
-            cursor.execute("DELETE FROM users")
-            
-            # Reset auto-increment counters
-            cursor.execute("DELETE FROM sqlite_sequence WHERE name IN ('commissions', 'payouts', 'monthly_summaries', 'audit_logs', 'pending_authorizations')")
-            
-            conn.commit()
-            conn.close()
-            return True
-        except Exception as e:
-            conn.rollback()
-            conn.close()
-            raise e
+            rows = cursor.fetchall()
+            # Shaped like commission rows so the utils date helpers accept them
+            return [
+                {"month": month, "date_added": day, "amount": from_cents(amount)}
+                for month, day, amount in rows
+            ]
 
     def add_commission(
         self,
@@ -337,114 +572,97 @@ class Database:
         split_partner: Decimal = None,
     ) -> int:
         """Add commission entry"""
-        from utils import get_current_month_year
-
         if month is None or year is None:
             month, year = get_current_month_year()
 
         if split_user is None or split_partner is None:
-            split_user = Decimal(str(amount * config.DEFAULT_SPLIT_USER))
-            split_partner = Decimal(str(amount * config.DEFAULT_SPLIT_PARTNER))
-
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        cursor.execute(
-            """
-            INSERT INTO commissions 
-            (user_id, amount, note, date_added, month, year, split_user, split_partner)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """,
-            (
-                user_id,
-                str(amount),
-                note,
-                datetime.now(timezone.utc).isoformat(),
-                month,
-                year,
-                str(split_user),
-                str(split_partner),
-            ),
-        )
+            split_user, split_partner = split_commission(amount)
 
-        commission_id = cursor.lastrowid
+        now = datetime.now(timezone.utc).isoformat()
+        with self._transaction() as cursor:
+            cursor.execute(
+                SQL_INSERT_COMMISSION,
+                (
+                    user_id,
+                    to_cents(amount),
+                    note,
+                    now,
+                    month,
+                    year,
+                    to_cents(split_user),
+                    to_cents(split_partner),
+                ),
+            )
 
-        # Log audit
-        cursor.execute(
-            """
-            INSERT INTO audit_logs (action_type, user_id, target_id, after_value, timestamp)
-            VALUES (?, ?, ?, ?, ?)
-        """,
-            (
-                "add",
-                user_id,
-                commission_id,
-                f"amount={amount}, split_user={split_user}, split_partner={split_partner}",
-                datetime.now(timezone.utc).isoformat(),
-            ),
-        )
+            commission_id = cursor.lastrowid
+
+            # Log audit. This stays a second statement: SQLite doesn't allow
+            # INSERT inside a WITH clause, and both already share one transaction.
+            cursor.execute(
+                SQL_INSERT_AUDIT,
+                (
+                    "add",
+                    user_id,
+                    commission_id,
+                    f"amount={amount}, split_user={split_user}, split_partner={split_partner}",
+                    now,
+                ),
+            )
 
-        conn.commit()
-        conn.close()
-        return commission_id
+            return commission_id
 
     def get_last_commission(self, user_id: int) -> Optional[Dict]:
         """Get last commission entry"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        cursor.execute(
-            """
-            SELECT * FROM commissions 
-            WHERE user_id = ? 
-            ORDER BY date_added DESC 
-            LIMIT 1
-        """,
-            (user_id,),
-        )
-
-        row = cursor.fetchone()
-        conn.close()
-        return dict(row) if row else None
+        with self._cursor() as cursor:
+            cursor.execute(SQL_GET_LAST_COMMISSION, (user_id,))
+
+            row = cursor.fetchone()
+            return dict(row) if row else None
+
+    def has_recent_duplicate(
+        self, user_id: int, amount: Decimal, window_minutes: int
+    ) -> bool:
+        """Check if the same amount was added within the last window_minutes"""
+        cutoff = (
+            datetime.now(timezone.utc) - timedelta(minutes=window_minutes)
+        ).isoformat()
+        with self._cursor() as cursor:
+            cursor.execute(SQL_HAS_RECENT_DUPLICATE, (user_id, cutoff, to_cents(amount)))
+            return bool(cursor.fetchone()[0])
 
     def delete_commission(self, commission_id: int, user_id: int) -> bool:
         """Delete commission entry (undo)"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        with self._transaction() as cursor:
+            # Get commission before deletion
+            cursor.execute(
+                f"SELECT {COMMISSION_COLS} FROM commissions WHERE id = ? AND user_id = ?",
+                (commission_id, user_id),
+            )
+            commission = cursor.fetchone()
 
-        # Get commission before deletion
-        cursor.execute(
-            "SELECT * FROM commissions WHERE id = ? AND user_id = ?",
-            (commission_id, user_id),
-        )
-        commission = cursor.fetchone()
-
-        if not commission:
-            conn.close()
-            return False
-
-        # Log audit
-        cursor.execute(
-            """
-            INSERT INTO audit_logs (action_type, user_id, target_id, before_value, timestamp)
-            VALUES (?, ?, ?, ?, ?)
-        """,
-            (
-                "undo",
-                user_id,
-                commission_id,
-                f"amount={commission['amount']}, split_user={commission['split_user']}, split_partner={commission['split_partner']}",
-                datetime.now(timezone.utc).isoformat(),
-            ),
-        )
+            if not commission:
+                return False
 
-        cursor.execute(
-            "DELETE FROM commissions WHERE id = ? AND user_id = ?",
-            (commission_id, user_id),
-        )
-        conn.commit()
-        conn.close()
-        return True
+            # Log audit
+            cursor.execute(
+                """
+                INSERT INTO audit_logs (action_type, user_id, target_id, before_value, timestamp)
+                VALUES (?, ?, ?, ?, ?)
+            """,
+                (
+                    "undo",
+                    user_id,
+                    commission_id,
+                    f"amount={commission['amount']}, split_user={commission['split_user']}, split_partner={commission['split_partner']}",
+                    datetime.now(timezone.utc).isoformat(),
+                ),
+            )
+
+            cursor.execute(
+                "DELETE FROM commissions WHERE id = ? AND user_id = ?",
+                (commission_id, user_id),
+            )
+            return True
 
     def get_commissions(
         self,
@@ -452,711 +670,271 @@ class Database:
         month: str = None,
         year: int = None,
         include_locked: bool = True,
-    ) -> List[Dict]:
+    ) -> List[sqlite3.Row]:
         """Get commissions for user, optionally filtered by month/year"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        query = "SELECT * FROM commissions WHERE user_id = ?"
         params = [user_id]
-
         if month and year:
-            query += " AND month = ? AND year = ?"
+            shape = "month"
             params.extend([month, year])
         elif not include_locked:
-            query += " AND locked = 0"
-
-        query += " ORDER BY date_added DESC"
-
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
-        conn.close()
-        return [dict(row) for row in rows]
-
-    def clear_database(self) -> bool:
-        """Clear all data from database (keeps schema)"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        try:
-            # Delete all data from all tables
-            cursor.execute("DELETE FROM audit_logs")
-            cursor.execute("DELETE FROM monthly_summaries")
-            cursor.execute("DELETE FROM payouts")
-            cursor.execute("DELETE FROM commissions")
-            cursor.execute("DELETE FROM pending_authorizations")
-            cursor.execute("DELETE FROM authorized_users")
-            cursor.execute("DELETE FROM users")
-            
-            # Reset auto-increment counters
-            cursor.execute("DELETE FROM sqlite_sequence WHERE name IN ('commissions', 'payouts', 'monthly_summaries', 'audit_logs', 'pending_authorizations')")
-            
-            conn.commit()
-            conn.close()
-            return True
-        except Exception as e:
-            conn.rollback()
-            conn.close()
-            raise e
-
-    def is_authorized(self, user_id: int) -> bool:
-        """Check if user is authorized"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        cursor.execute("SELECT * FROM authorized_users WHERE user_id = ?", (user_id,))
-        result = cursor.fetchone()
-        conn.close()
-        return result is not None
-
-    def add_pending_authorization(self, user_id: int, username: str | None = None, full_name: str | None = None) -> int:
-        """Add pending authorization request"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        # Check if already pending
-        cursor.execute("SELECT * FROM pending_authorizations WHERE user_id = ?", (user_id,))
-        existing = cursor.fetchone()
-
-        if existing:
-            conn.close()
-            return existing['id']
-
-        cursor.execute("""
-            INSERT INTO pending_authorizations (user_id, username, full_name)
-            VALUES (?, ?, ?)
-        """, (user_id, username, full_name))
-
-        request_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return request_id
-
-    def get_pending_authorizations(self) -> List[Dict]:
-        """Get all pending authorization requests"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            SELECT * FROM pending_authorizations 
-            ORDER BY requested_at DESC
-        """)
-        rows = cursor.fetchall()
-        conn.close()
-        return [dict(row) for row in rows]
-
-    def clear_database(self) -> bool:
-        """Clear all data from database (keeps schema)"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        try:
-            # Delete all data from all tables
-            cursor.execute("DELETE FROM audit_logs")
-            cursor.execute("DELETE FROM monthly_summaries")
-            cursor.execute("DELETE FROM payouts")
-            cursor.execute("DELETE FROM commissions")
-            cursor.execute("DELETE FROM pending_authorizations")
-            cursor.execute("DELETE FROM authorized_users")
-            cursor.execute("DELETE FROM users")
-            
-            # Reset auto-increment counters
-            cursor.execute("DELETE FROM sqlite_sequence WHERE name IN ('commissions', 'payouts', 'monthly_summaries', 'audit_logs', 'pending_authorizations')")
-            
-            conn.commit()
-            conn.close()
-            return True
-        except Exception as e:
-            conn.rollback()
-            conn.close()
-            raise e
-
-    def approve_user(self, user_id: int, authorized_by: int) -> bool:
-        """Approve user authorization"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+            shape = "unlocked"
+        else:
+            shape = "all"
 
-        # Check if already authorized
-        if self.is_authorized(user_id):
-            conn.close()
-            return False
+        with self._cursor() as cursor:
+            cursor.execute(SQL_GET_COMMISSIONS[shape], params)
+            return cursor.fetchall()
 
-        # Add to authorized users
-        cursor.execute("""
-            INSERT INTO authorized_users (user_id, authorized_by)
-            VALUES (?, ?)
-        """, (user_id, authorized_by))
+    def get_commissions_by_year(self, user_id: int, year: int) -> List[sqlite3.Row]:
+        """Get all commissions for user in a year, newest first"""
+        with self._cursor() as cursor:
+            cursor.execute(SQL_GET_COMMISSIONS_YEAR, (user_id, year))
 
-        # Remove from pending
-        cursor.execute("DELETE FROM pending_authorizations WHERE user_id = ?", (user_id,))
+            return cursor.fetchall()
 
-        conn.commit()
-        conn.close()
-        return True
-
-    def revoke_user(self, user_id: int) -> bool:
-        """Revoke user authorization"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        cursor.execute("DELETE FROM authorized_users WHERE user_id = ?", (user_id,))
-        deleted = cursor.rowcount > 0
-
-        conn.commit()
-        conn.close()
-        return deleted
+    def get_monthly_totals(self, user_id: int, month: str, year: int) -> Dict:
+        """Get commission totals and entry count for a month"""
+        with self._cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT COALESCE(SUM(amount), 0), COALESCE(SUM(split_user), 0),
+                       COALESCE(SUM(split_partner), 0), COUNT(*)
+                FROM commissions
+                WHERE user_id = ? AND month = ? AND year = ?
+            """,
+                (user_id, month, year),
+            )
 
-    def get_authorized_users(self) -> List[Dict]:
-        """Get all authorized users"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            SELECT au.user_id, au.authorized_at, u.name 
-            FROM authorized_users au
-            LEFT JOIN users u ON au.user_id = u.user_id
-            ORDER BY au.authorized_at DESC
-        """)
-        rows = cursor.fetchall()
-        conn.close()
-        return [dict(row) for row in rows]
-
-    def clear_database(self) -> bool:
-        """Clear all data from database (keeps schema)"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        try:
-            # Delete all data from all tables
-            cursor.execute("DELETE FROM audit_logs")
-            cursor.execute("DELETE FROM monthly_summaries")
-            cursor.execute("DELETE FROM payouts")
-            cursor.execute("DELETE FROM commissions")
-            cursor.execute("DELETE FROM pending_authorizations")
-            cursor.execute("DELETE FROM authorized_users")
-            cursor.execute("DELETE FROM users")
-            
-            # Reset auto-increment counters
-            cursor.execute("DELETE FROM sqlite_sequence WHERE name IN ('commissions', 'payouts', 'monthly_summaries', 'audit_logs', 'pending_authorizations')")
-            
-            conn.commit()
-            conn.close()
-            return True
-        except Exception as e:
-            conn.rollback()
-            conn.close()
-            raise e
+            total_commission, split_user, split_partner, entries_count = cursor.fetchone()
+            return {
+                "total_commission": from_cents(total_commission),
+                "split_user": from_cents(split_user),
+                "split_partner": from_cents(split_partner),
+                "entries_count": entries_count,
+            }
 
     def add_payout(self, user_id: int, amount: Decimal, month: str, year: int) -> int:
         """Record payout to partner"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        cursor.execute(
-            """
-            INSERT INTO payouts (user_id, amount, date_paid, month, year)
-            VALUES (?, ?, ?, ?, ?)
-        """,
-            (user_id, str(amount), datetime.now(timezone.utc).isoformat(), month, year),
-        )
+        now = datetime.now(timezone.utc).isoformat()
+        with self._transaction() as cursor:
+            cursor.execute(
+                SQL_INSERT_PAYOUT,
+                (user_id, to_cents(amount), now, month, year),
+            )
 
-        payout_id = cursor.lastrowid
+            payout_id = cursor.lastrowid
 
-        # Log audit
-        cursor.execute(
-            """
-            INSERT INTO audit_logs (action_type, user_id, target_id, after_value, timestamp)
-            VALUES (?, ?, ?, ?, ?)
-        """,
-            (
-                "payout",
-                user_id,
-                payout_id,
-                f"amount={amount}, month={month}, year={year}",
-                datetime.now(timezone.utc).isoformat(),
-            ),
-        )
+            # Log audit
+            cursor.execute(
+                SQL_INSERT_AUDIT,
+                (
+                    "payout",
+                    user_id,
+                    payout_id,
+                    f"amount={amount}, month={month}, year={year}",
+                    now,
+                ),
+            )
 
-        conn.commit()
-        conn.close()
-        return payout_id
+            return payout_id
 
     def get_payouts(
         self, user_id: int, month: str = None, year: int = None
-    ) -> List[Dict]:
+    ) -> List[sqlite3.Row]:
         """Get payouts for user"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        query = "SELECT * FROM payouts WHERE user_id = ?"
-        params = [user_id]
-
-        if month and year:
-            query += " AND month = ? AND year = ?"
-            params.extend([month, year])
-
-        query += " ORDER BY date_paid DESC"
-
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
-        conn.close()
-        return [dict(row) for row in rows]
-
-    def clear_database(self) -> bool:
-        """Clear all data from database (keeps schema)"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        try:
-            # Delete all data from all tables
-            cursor.execute("DELETE FROM audit_logs")
-            cursor.execute("DELETE FROM monthly_summaries")
-            cursor.execute("DELETE FROM payouts")
-            cursor.execute("DELETE FROM commissions")
-            cursor.execute("DELETE FROM pending_authorizations")
-            cursor.execute("DELETE FROM authorized_users")
-            cursor.execute("DELETE FROM users")
-            
-            # Reset auto-increment counters
-            cursor.execute("DELETE FROM sqlite_sequence WHERE name IN ('commissions', 'payouts', 'monthly_summaries', 'audit_logs', 'pending_authorizations')")
-            
-            conn.commit()
-            conn.close()
-            return True
-        except Exception as e:
-            conn.rollback()
-            conn.close()
-            raise e
-
-    def is_authorized(self, user_id: int) -> bool:
-        """Check if user is authorized"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        cursor.execute("SELECT * FROM authorized_users WHERE user_id = ?", (user_id,))
-        result = cursor.fetchone()
-        conn.close()
-        return result is not None
-
-    def add_pending_authorization(self, user_id: int, username: str | None = None, full_name: str | None = None) -> int:
-        """Add pending authorization request"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        # Check if already pending
-        cursor.execute("SELECT * FROM pending_authorizations WHERE user_id = ?", (user_id,))
-        existing = cursor.fetchone()
-
-        if existing:
-            conn.close()
-            return existing['id']
-
-        cursor.execute("""
-            INSERT INTO pending_authorizations (user_id, username, full_name)
-            VALUES (?, ?, ?)
-        """, (user_id, username, full_name))
-
-        request_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return request_id
-
-    def get_pending_authorizations(self) -> List[Dict]:
-        """Get all pending authorization requests"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            SELECT * FROM pending_authorizations 
-            ORDER BY requested_at DESC
-        """)
-        rows = cursor.fetchall()
-        conn.close()
-        return [dict(row) for row in rows]
-
-    def clear_database(self) -> bool:
-        """Clear all data from database (keeps schema)"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        try:
-            # Delete all data from all tables
-            cursor.execute("DELETE FROM audit_logs")
-            cursor.execute("DELETE FROM monthly_summaries")
-            cursor.execute("DELETE FROM payouts")
-            cursor.execute("DELETE FROM commissions")
-            cursor.execute("DELETE FROM pending_authorizations")
-            cursor.execute("DELETE FROM authorized_users")
-            cursor.execute("DELETE FROM users")
-            
-            # Reset auto-increment counters
-            cursor.execute("DELETE FROM sqlite_sequence WHERE name IN ('commissions', 'payouts', 'monthly_summaries', 'audit_logs', 'pending_authorizations')")
-            
-            conn.commit()
-            conn.close()
-            return True
-        except Exception as e:
-            conn.rollback()
-            conn.close()
-            raise e
-
-    def approve_user(self, user_id: int, authorized_by: int) -> bool:
-        """Approve user authorization"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        # Check if already authorized
-        if self.is_authorized(user_id):
-            conn.close()
-            return False
-
-        # Add to authorized users
-        cursor.execute("""
-            INSERT INTO authorized_users (user_id, authorized_by)
-            VALUES (?, ?)
-        """, (user_id, authorized_by))
+        with self._cursor() as cursor:
+            if month and year:
+                cursor.execute(SQL_GET_PAYOUTS_MONTH, (user_id, month, year))
+            else:
+                cursor.execute(SQL_GET_PAYOUTS, (user_id,))
+            return cursor.fetchall()
 
-        # Remove from pending
-        cursor.execute("DELETE FROM pending_authorizations WHERE user_id = ?", (user_id,))
-
-        conn.commit()
-        conn.close()
-        return True
-
-    def revoke_user(self, user_id: int) -> bool:
-        """Revoke user authorization"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+    def close_month(self, user_id: int, month: str, year: int) -> str:
+        """Close month and generate statement"""
+        return self.close_month_bulk([user_id], month, year)[user_id]
 
-        cursor.execute("DELETE FROM authorized_users WHERE user_id = ?", (user_id,))
-        deleted = cursor.rowcount > 0
+    def close_month_bulk(
+        self, user_ids: List[int], month: str, year: int
+    ) -> Dict[int, str]:
+        """Close month for several users in one transaction, returning statement IDs"""
+        if not user_ids:
+            return {}
 
-        conn.commit()
-        conn.close()
-        return deleted
+        with self._transaction() as cursor:
+            placeholders = ",".join("?" * len(user_ids))
 
-    def get_authorized_users(self) -> List[Dict]:
-        """Get all authorized users"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            SELECT au.user_id, au.authorized_at, u.name 
-            FROM authorized_users au
-            LEFT JOIN users u ON au.user_id = u.user_id
-            ORDER BY au.authorized_at DESC
-        """)
-        rows = cursor.fetchall()
-        conn.close()
-        return [dict(row) for row in rows]
+            # Calculate totals (in cents) for all users in one grouped query
+            totals = {uid: (0, 0, 0) for uid in user_ids}
+            cursor.execute(
+                f"""
+                SELECT user_id, SUM(amount), SUM(split_user), SUM(split_partner)
+                FROM commissions
+                WHERE month = ? AND year = ? AND user_id IN ({placeholders})
+                GROUP BY user_id
+            """,
+                (month, year, *user_ids),
+            )
+            for uid, amount, split_user, split_partner in cursor.fetchall():
+                totals[uid] = (amount, split_user, split_partner)
 
-    def clear_database(self) -> bool:
-        """Clear all data from database (keeps schema)"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        try:
-            # Delete all data from all tables
-            cursor.execute("DELETE FROM audit_logs")
-            cursor.execute("DELETE FROM monthly_summaries")
-            cursor.execute("DELETE FROM payouts")
-            cursor.execute("DELETE FROM commissions")
-            cursor.execute("DELETE FROM pending_authorizations")
-            cursor.execute("DELETE FROM authorized_users")
-            cursor.execute("DELETE FROM users")
-            
-            # Reset auto-increment counters
-            cursor.execute("DELETE FROM sqlite_sequence WHERE name IN ('commissions', 'payouts', 'monthly_summaries', 'audit_logs', 'pending_authorizations')")
-            
-            conn.commit()
-            conn.close()
-            return True
-        except Exception as e:
-            conn.rollback()
-            conn.close()
-            raise e
+            statement_ids = {
+                uid: generate_statement_id(uid, month, year) for uid in user_ids
+            }
+            now = datetime.now(timezone.utc).isoformat()
 
-    def close_month(self, user_id: int, month: str, year: int) -> str:
-        """Close month and generate statement"""
-        from utils import generate_statement_id
-        from decimal import Decimal
-
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        # Calculate totals
-        commissions = self.get_commissions(user_id, month, year)
-        total_commission = sum(Decimal(c["amount"]) for c in commissions)
-        split_user = sum(Decimal(c["split_user"]) for c in commissions)
-        split_partner = sum(Decimal(c["split_partner"]) for c in commissions)
-
-        statement_id = generate_statement_id(user_id, month, year)
-
-        # Create or update summary
-        cursor.execute(
-            """
-            INSERT OR REPLACE INTO monthly_summaries
-            (user_id, month, year, total_commission, split_user, split_partner, statement_id, closed, generated_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """,
-            (
-                user_id,
-                month,
-                year,
-                str(total_commission),
-                str(split_user),
-                str(split_partner),
-                statement_id,
-                1,
-                datetime.now(timezone.utc).isoformat(),
-            ),
-        )
+            # Create or update summaries
+            cursor.executemany(
+                """
+                INSERT INTO monthly_summaries
+                (user_id, month, year, total_commission, split_user, split_partner, statement_id, closed, generated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """ + SQL_UPSERT_SUMMARY_TAIL,
+                [
+                    (uid, month, year, t[0], t[1], t[2], statement_ids[uid], 1, now)
+                    for uid, t in totals.items()
+                ],
+            )
 
-        # Lock commissions
-        cursor.execute(
-            """
-            UPDATE commissions 
-            SET locked = 1 
-            WHERE user_id = ? AND month = ? AND year = ?
-        """,
-            (user_id, month, year),
-        )
+            # Lock commissions
+            cursor.execute(
+                f"""
+                UPDATE commissions
+                SET locked = 1
+                WHERE month = ? AND year = ? AND user_id IN ({placeholders})
+            """,
+                (month, year, *user_ids),
+            )
 
-        # Log audit
-        cursor.execute(
-            """
-            INSERT INTO audit_logs (action_type, user_id, after_value, timestamp)
-            VALUES (?, ?, ?, ?)
-        """,
-            (
-                "month_close",
-                user_id,
-                f"month={month}, year={year}, statement_id={statement_id}",
-                datetime.now(timezone.utc).isoformat(),
-            ),
-        )
+            # Log audit
+            cursor.executemany(
+                """
+                INSERT INTO audit_logs (action_type, user_id, after_value, timestamp)
+                VALUES (?, ?, ?, ?)
+            """,
+                [
+                    (
+                        "month_close",
+                        uid,
+                        f"month={month}, year={year}, statement_id={statement_ids[uid]}",
+                        now,
+                    )
+                    for uid in user_ids
+                ],
+            )
 
-        conn.commit()
-        conn.close()
-        return statement_id
+            return statement_ids
 
     def get_monthly_summary(
         self, user_id: int, month: str, year: int
     ) -> Optional[Dict]:
         """Get monthly summary"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        cursor.execute(
-            """
-            SELECT * FROM monthly_summaries 
-            WHERE user_id = ? AND month = ? AND year = ?
-        """,
-            (user_id, month, year),
-        )
+        with self._cursor() as cursor:
+            cursor.execute(SQL_GET_MONTHLY_SUMMARY, (user_id, month, year))
 
-        row = cursor.fetchone()
-        conn.close()
-        return dict(row) if row else None
+            row = cursor.fetchone()
+            return dict(row) if row else None
 
     def get_all_monthly_summaries(self, user_id: int, year: int = None) -> List[Dict]:
         """Get all monthly summaries for user"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        with self._cursor() as cursor:
+            if year:
+                cursor.execute(SQL_GET_MONTHLY_SUMMARIES_YEAR, (user_id, year))
+            else:
+                cursor.execute(SQL_GET_MONTHLY_SUMMARIES, (user_id,))
 
-        if year:
-            cursor.execute(
-                """
-                SELECT * FROM monthly_summaries 
-                WHERE user_id = ? AND year = ?
-                ORDER BY year DESC, month DESC
-            """,
-                (user_id, year),
-            )
-        else:
-            cursor.execute(
-                """
-                SELECT * FROM monthly_summaries 
-                WHERE user_id = ?
-                ORDER BY year DESC, month DESC
-            """,
-                (user_id,),
-            )
-
-        rows = cursor.fetchall()
-        conn.close()
-        return [dict(row) for row in rows]
-
-    def clear_database(self) -> bool:
-        """Clear all data from database (keeps schema)"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        try:
-            # Delete all data from all tables
-            cursor.execute("DELETE FROM audit_logs")
-            cursor.execute("DELETE FROM monthly_summaries")
-            cursor.execute("DELETE FROM payouts")
-            cursor.execute("DELETE FROM commissions")
-            cursor.execute("DELETE FROM pending_authorizations")
-            cursor.execute("DELETE FROM authorized_users")
-            cursor.execute("DELETE FROM users")
-            
-            # Reset auto-increment counters
-            cursor.execute("DELETE FROM sqlite_sequence WHERE name IN ('commissions', 'payouts', 'monthly_summaries', 'audit_logs', 'pending_authorizations')")
-            
-            conn.commit()
-            conn.close()
-            return True
-        except Exception as e:
-            conn.rollback()
-            conn.close()
-            raise e
+            return _fetch_dicts(cursor)
 
     def is_authorized(self, user_id: int) -> bool:
         """Check if user is authorized"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        cursor.execute("SELECT * FROM authorized_users WHERE user_id = ?", (user_id,))
-        result = cursor.fetchone()
-        conn.close()
-        return result is not None
+        with self._cursor() as cursor:
+            cursor.execute(SQL_IS_AUTHORIZED, (user_id,))
+            return cursor.fetchone() is not None
 
     def add_pending_authorization(self, user_id: int, username: str | None = None, full_name: str | None = None) -> int:
         """Add pending authorization request"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        # Check if already pending
-        cursor.execute("SELECT * FROM pending_authorizations WHERE user_id = ?", (user_id,))
-        existing = cursor.fetchone()
-
-        if existing:
-            conn.close()
-            return existing['id']
-
-        cursor.execute("""
-            INSERT INTO pending_authorizations (user_id, username, full_name)
-            VALUES (?, ?, ?)
-        """, (user_id, username, full_name))
+        # Repeat requests are the common case; answer them without the write lock
+        with self._cursor() as cursor:
+            cursor.execute(SQL_GET_PENDING_AUTHORIZATION_ID, (user_id,))
+            row = cursor.fetchone()
+            if row:
+                return row["id"]
+
+        with self._transaction() as cursor:
+            cursor.execute(
+                SQL_INSERT_PENDING_AUTHORIZATION, (user_id, username, full_name, user_id)
+            )
+            if cursor.rowcount > 0:
+                return cursor.lastrowid
 
-        request_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return request_id
+            # Another caller got there first; return that request
+            cursor.execute(SQL_GET_PENDING_AUTHORIZATION_ID, (user_id,))
+            return cursor.fetchone()["id"]
 
     def get_pending_authorizations(self) -> List[Dict]:
         """Get all pending authorization requests"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            SELECT * FROM pending_authorizations 
-            ORDER BY requested_at DESC
-        """)
-        rows = cursor.fetchall()
-        conn.close()
-        return [dict(row) for row in rows]
+        with self._cursor() as cursor:
+            cursor.execute(SQL_GET_PENDING_AUTHORIZATIONS)
+            return _fetch_dicts(cursor)
 
-    def clear_database(self) -> bool:
-        """Clear all data from database (keeps schema)"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        try:
-            # Delete all data from all tables
-            cursor.execute("DELETE FROM audit_logs")
-            cursor.execute("DELETE FROM monthly_summaries")
-            cursor.execute("DELETE FROM payouts")
-            cursor.execute("DELETE FROM commissions")
-            cursor.execute("DELETE FROM pending_authorizations")
-            cursor.execute("DELETE FROM authorized_users")
-            cursor.execute("DELETE FROM users")
-            
-            # Reset auto-increment counters
-            cursor.execute("DELETE FROM sqlite_sequence WHERE name IN ('commissions', 'payouts', 'monthly_summaries', 'audit_logs', 'pending_authorizations')")
-            
-            conn.commit()
-            conn.close()
-            return True
-        except Exception as e:
-            conn.rollback()
-            conn.close()
-            raise e
-
-    def approve_user(self, user_id: int, authorized_by: int) -> bool:
+    def approve_user(self, user_id: int, authorized_by: int, name: str = None) -> bool:
         """Approve user authorization"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        # Check if already authorized
-        if self.is_authorized(user_id):
-            conn.close()
-            return False
-
-        # Add to authorized users
-        cursor.execute("""
-            INSERT INTO authorized_users (user_id, authorized_by)
-            VALUES (?, ?)
-        """, (user_id, authorized_by))
-
-        # Remove from pending
-        cursor.execute("DELETE FROM pending_authorizations WHERE user_id = ?", (user_id,))
-
-        conn.commit()
-        conn.close()
-        return True
+        with self._transaction() as cursor:
+            # Authorize and clear the pending request in one transaction
+            cursor.execute("""
+                INSERT OR IGNORE INTO authorized_users (user_id, authorized_by)
+                VALUES (?, ?)
+            """, (user_id, authorized_by))
+            approved = cursor.rowcount > 0
+
+            # Make sure the user row exists, named from the caller or the pending
+            # request if either knows the name; fills in a "User_<id>" placeholder
+            cursor.execute("""
+                INSERT INTO users (user_id, name)
+                VALUES (?, COALESCE(
+                    ?,
+                    (SELECT full_name FROM pending_authorizations
+                     WHERE user_id = ? ORDER BY id DESC LIMIT 1),
+                    ?
+                ))
+                ON CONFLICT(user_id) DO UPDATE SET name = excluded.name
+                WHERE name = 'User_' || user_id
+            """, (user_id, name or None, user_id, f"User_{user_id}"))
+
+            # Remove from pending
+            cursor.execute("DELETE FROM pending_authorizations WHERE user_id = ?", (user_id,))
+
+        return approved
 
     def revoke_user(self, user_id: int) -> bool:
         """Revoke user authorization"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        cursor.execute("DELETE FROM authorized_users WHERE user_id = ?", (user_id,))
-        deleted = cursor.rowcount > 0
+        with self._transaction() as cursor:
+            cursor.execute("DELETE FROM authorized_users WHERE user_id = ?", (user_id,))
+            deleted = cursor.rowcount > 0
 
-        conn.commit()
-        conn.close()
         return deleted
 
+    def remove_pending_authorization(self, user_id: int) -> bool:
+        """Remove pending authorization request (deny)"""
+        with self._transaction() as cursor:
+            cursor.execute("DELETE FROM pending_authorizations WHERE user_id = ?", (user_id,))
+            deleted = cursor.rowcount > 0
+
+            return deleted
+
     def get_authorized_users(self) -> List[Dict]:
         """Get all authorized users"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            SELECT au.user_id, au.authorized_at, u.name 
-            FROM authorized_users au
-            LEFT JOIN users u ON au.user_id = u.user_id
-            ORDER BY au.authorized_at DESC
-        """)
-        rows = cursor.fetchall()
-        conn.close()
-        return [dict(row) for row in rows]
+        with self._cursor() as cursor:
+            cursor.execute("""
+                SELECT au.user_id, au.authorized_at, u.name 
+                FROM authorized_users au
+                LEFT JOIN users u ON au.user_id = u.user_id
+                ORDER BY au.authorized_at DESC
+            """)
+            return _fetch_dicts(cursor)
 
     def clear_database(self) -> bool:
         """Clear all data from database (keeps schema)"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        try:
-            # Delete all data from all tables
-            cursor.execute("DELETE FROM audit_logs")
-            cursor.execute("DELETE FROM monthly_summaries")
-            cursor.execute("DELETE FROM payouts")
-            cursor.execute("DELETE FROM commissions")
-            cursor.execute("DELETE FROM pending_authorizations")
-            cursor.execute("DELETE FROM authorized_users")
-            cursor.execute("DELETE FROM users")
-            
-            # Reset auto-increment counters
-            cursor.execute("DELETE FROM sqlite_sequence WHERE name IN ('commissions', 'payouts', 'monthly_summaries', 'audit_logs', 'pending_authorizations')")
-            
-            conn.commit()
-            conn.close()
-            return True
-        except Exception as e:
-            conn.rollback()
-            conn.close()
-            raise e
+        with self._cursor() as cursor:
+            # Runs its own BEGIN/COMMIT; _cursor rolls back if a statement fails
+            cursor.executescript(SQL_CLEAR_DATABASE)
+        return True
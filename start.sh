@@ -42,6 +42,9 @@ DUPLICATE_DETECTION_MINUTES = 2
 ZERO_ACTIVITY_DAYS = 7
 EXTREME_AMOUNT_MULTIPLIER = 2.0  # Alert if >2x monthly average
 
+# Scheduler Settings
+BROADCAST_CONCURRENCY = 20  # Max scheduled messages sent in parallel
+
 # Split Settings
 DEFAULT_SPLIT_USER = 0.5
 DEFAULT_SPLIT_PARTNER = 0.5
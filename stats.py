@@ -2,9 +2,11 @@
 Statistics calculation for Commission Tracker Bot
 """
 
+import heapq
+from collections import defaultdict
 from decimal import Decimal
 from typing import Dict, List, Optional
-from utils import format_kes, get_days_active, get_weekly_totals, get_daily_totals
+from utils import format_kes, get_weekly_totals, parse_date
 
 
 def calculate_monthly_stats(
@@ -30,23 +32,46 @@ def calculate_monthly_stats(
             "owed_to_partner": Decimal("0"),
         }
 
-    total_commission = sum(Decimal(c["amount"]) for c in commissions)
-    split_user = sum(Decimal(c["split_user"]) for c in commissions)
-    split_partner = sum(Decimal(c["split_partner"]) for c in commissions)
-
-    largest = max(commissions, key=lambda x: Decimal(x["amount"]))
-    smallest = min(commissions, key=lambda x: Decimal(x["amount"]))
-
-    daily_totals = get_daily_totals(commissions)
-    weekly_totals = get_weekly_totals(commissions)
-    days_active = get_days_active(commissions)
+    # One pass over the entries, parsing each date once, instead of separate
+    # sums, max/min and the utils daily/weekly/active-day helpers
+    total_commission = Decimal("0")
+    split_user = Decimal("0")
+    split_partner = Decimal("0")
+    largest = smallest = None
+    largest_amount = smallest_amount = None
+    daily = defaultdict(Decimal)
+    weekly = defaultdict(Decimal)
+
+    for c in commissions:
+        amount = c["amount"]
+        total_commission += amount
+        split_user += c["split_user"]
+        split_partner += c["split_partner"]
+
+        # Strict comparisons keep the first entry on ties, like max()/min()
+        if largest is None or amount > largest_amount:
+            largest, largest_amount = c, amount
+        if smallest is None or amount < smallest_amount:
+            smallest, smallest_amount = c, amount
+
+        try:
+            comm_time = parse_date(c["date_added"])
+        except (ValueError, TypeError, OverflowError):
+            continue
+        daily[comm_time.strftime("%Y-%m-%d")] += amount
+        weekly[f"Week {comm_time.isocalendar()[1]}"] += amount
+
+    daily_totals = dict(daily)
+    weekly_totals = dict(weekly)
+    # Each day key is one distinct calendar date
+    days_active = len(daily)
 
     # Calculate days inactive (assuming 30-day month for simplicity)
     # In production, use actual days in month
     days_inactive = 30 - days_active
 
     total_payouts = (
-        sum(Decimal(p["amount"]) for p in payouts) if payouts else Decimal("0")
+        sum(p["amount"] for p in payouts) if payouts else Decimal("0")
     )
     owed_to_partner = split_partner - total_payouts
 
@@ -70,11 +95,15 @@ def calculate_monthly_stats(
 
 
 def calculate_yearly_stats(
-    monthly_summaries: List[Dict], commissions: Optional[List[Dict]] = None
+    monthly_summaries: List[Dict],
+    month_aggregates: Optional[List[Dict]] = None,
+    daily_totals: Optional[List[Dict]] = None,
 ) -> Dict:
-    """Calculate detailed yearly statistics"""
-    if commissions is None:
-        commissions = []
+    """Calculate detailed yearly statistics from per-month and per-day aggregates"""
+    if month_aggregates is None:
+        month_aggregates = []
+    if daily_totals is None:
+        daily_totals = []
     if not monthly_summaries:
         return {
             "total_commission": Decimal("0"),
@@ -89,32 +118,44 @@ def calculate_yearly_stats(
             "top_weeks": [],
         }
 
-    total_commission = sum(Decimal(m["total_commission"]) for m in monthly_summaries)
-    total_split_user = sum(Decimal(m["split_user"]) for m in monthly_summaries)
-    total_split_partner = sum(Decimal(m["split_partner"]) for m in monthly_summaries)
-
+    # At most twelve rows, all needed for the breakdown, so total them in the
+    # same pass rather than in separate SQL aggregates
+    total_commission = Decimal("0")
+    total_split_user = Decimal("0")
+    total_split_partner = Decimal("0")
+    largest_month = smallest_month = None
+    largest_total = smallest_total = None
     monthly_breakdown = {}
+
     for summary in monthly_summaries:
+        total = summary["total_commission"]
+        split_user = summary["split_user"]
+        split_partner = summary["split_partner"]
+        total_commission += total
+        total_split_user += split_user
+        total_split_partner += split_partner
+
         month_key = f"{summary['year']}-{summary['month']}"
         monthly_breakdown[month_key] = {
-            "total": Decimal(summary["total_commission"]),
-            "split_user": Decimal(summary["split_user"]),
-            "split_partner": Decimal(summary["split_partner"]),
+            "total": total,
+            "split_user": split_user,
+            "split_partner": split_partner,
             "statement_id": summary["statement_id"],
         }
 
-    largest_month = max(monthly_summaries, key=lambda x: Decimal(x["total_commission"]))
-    smallest_month = min(
-        monthly_summaries, key=lambda x: Decimal(x["total_commission"])
-    )
+        # Strict comparisons keep the first month on ties, like max()/min()
+        if largest_month is None or total > largest_total:
+            largest_month, largest_total = summary, total
+        if smallest_month is None or total < smallest_total:
+            smallest_month, smallest_total = summary, total
 
-    # Calculate weekly stats if commissions provided
+    # Calculate weekly stats if daily totals provided
     top_weeks = []
-    if commissions:
-        weekly_totals = get_weekly_totals(commissions)
-        top_weeks = sorted(weekly_totals.items(), key=lambda x: x[1], reverse=True)[:5]
+    if daily_totals:
+        weekly_totals = get_weekly_totals(daily_totals)
+        top_weeks = heapq.nlargest(5, weekly_totals.items(), key=lambda x: x[1])
 
-    total_entries = len(commissions) if commissions else 0
+    total_entries = sum(m["entries_count"] for m in month_aggregates)
 
     return {
         "total_commission": total_commission,
@@ -145,16 +186,16 @@ def format_monthly_stats(stats: Dict) -> str:
 
     if stats["largest_entry"]:
         lines.append(
-            f"\n🔥 Largest Entry: {format_kes(Decimal(stats['largest_entry']['amount']))}"
+            f"\n🔥 Largest Entry: {format_kes(stats['largest_entry']['amount'])}"
         )
-        if stats["largest_entry"].get("note"):
+        if stats["largest_entry"]["note"]:
             lines.append(f"   Note: {stats['largest_entry']['note']}")
 
     if stats["smallest_entry"]:
         lines.append(
-            f"❄️ Smallest Entry: {format_kes(Decimal(stats['smallest_entry']['amount']))}"
+            f"❄️ Smallest Entry: {format_kes(stats['smallest_entry']['amount'])}"
         )
-        if stats["smallest_entry"].get("note"):
+        if stats["smallest_entry"]["note"]:
             lines.append(f"   Note: {stats['smallest_entry']['note']}")
 
     lines.append("\n📅 Activity:")
@@ -163,8 +204,11 @@ def format_monthly_stats(stats: Dict) -> str:
 
     if stats["weekly_totals"]:
         lines.append("\n📊 Weekly Totals:")
-        for week, total in sorted(stats["weekly_totals"].items()):
-            lines.append(f"   {week}: {format_kes(total)}")
+        # Same format as format_kes, inlined to skip a call per row
+        lines.extend(
+            f"   {week}: KES {total:,.2f}"
+            for week, total in sorted(stats["weekly_totals"].items())
+        )
 
     if stats["total_payouts"] > 0:
         lines.append(f"\n💸 Payouts Made: {format_kes(stats['total_payouts'])}")
@@ -191,7 +235,7 @@ def format_yearly_stats(stats: Dict) -> str:
         )
         lines.append(f"\n🔥 Largest Month: {month_key}")
         lines.append(
-            f"   Total: {format_kes(Decimal(stats['largest_month']['total_commission']))}"
+            f"   Total: {format_kes(stats['largest_month']['total_commission'])}"
         )
         lines.append(f"   Statement: {stats['largest_month']['statement_id']}")
 
@@ -201,17 +245,19 @@ def format_yearly_stats(stats: Dict) -> str:
         )
         lines.append(f"\n❄️ Smallest Month: {month_key}")
         lines.append(
-            f"   Total: {format_kes(Decimal(stats['smallest_month']['total_commission']))}"
+            f"   Total: {format_kes(stats['smallest_month']['total_commission'])}"
         )
 
     if stats["monthly_breakdown"]:
         lines.append("\n📊 Monthly Breakdown:")
-        for month, data in sorted(stats["monthly_breakdown"].items()):
-            lines.append(f"   {month}: {format_kes(data['total'])}")
+        # Same format as format_kes, inlined to skip a call per row
+        lines.extend(
+            f"   {month}: KES {data['total']:,.2f}"
+            for month, data in sorted(stats["monthly_breakdown"].items())
+        )
 
     if stats["top_weeks"]:
         lines.append("\n🏆 Top 5 Weeks:")
-        for week, total in stats["top_weeks"]:
-            lines.append(f"   {week}: {format_kes(total)}")
+        lines.extend(f"   {week}: KES {total:,.2f}" for week, total in stats["top_weeks"])
 
     return "\n".join(lines)
@@ -1,24 +1,50 @@
 """
 Utility functions for Commission Tracker Bot
 """
-from datetime import datetime, timedelta
-from decimal import Decimal
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal, ROUND_HALF_UP
+from fractions import Fraction
+from functools import lru_cache
 from typing import Dict, Tuple, Optional
-import pytz
+from zoneinfo import ZoneInfo
+from dateutil import parser
 import config
 
+# Configured timezone, resolved once
+_TZ = ZoneInfo(config.DEFAULT_TIMEZONE)
 
-def get_user_timezone(user_id: int = None) -> pytz.timezone:
+
+@lru_cache(maxsize=4096)
+def parse_date(value: str) -> datetime:
+    """Parse a stored timestamp, caching the result per string"""
+    # Timestamps written by this bot are ISO 8601, which fromisoformat parses
+    # far faster than dateutil; dateutil remains the fallback for anything else
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return parser.parse(value)
+
+
+def get_user_timezone(user_id: int = None) -> ZoneInfo:
     """Get user timezone (default: Africa/Nairobi)"""
     # For now, use default. Can be extended to fetch from database
-    return pytz.timezone(config.DEFAULT_TIMEZONE)
+    return _TZ
+
+
+@lru_cache(maxsize=256)
+def _cached_month_year(tz: ZoneInfo, minute_bucket: int) -> Tuple[str, int]:
+    """Month and year at the start of a minute bucket in the given timezone"""
+    now = datetime.fromtimestamp(minute_bucket * 60, tz)
+    return now.strftime("%Y-%m"), now.year
 
 
 def get_current_month_year(user_id: int = None) -> Tuple[str, int]:
     """Get current month and year in user's timezone"""
-    tz = get_user_timezone(user_id)
-    now = datetime.now(tz)
-    return now.strftime("%Y-%m"), now.year
+    # Month boundaries fall on whole minutes, so the result is stable per minute.
+    # Keyed on the resolved timezone, so users sharing one share the entry.
+    return _cached_month_year(get_user_timezone(user_id), int(time.time() // 60))
 
 
 def parse_month_year(month_str: str = None) -> Tuple[str, int]:
@@ -50,6 +76,7 @@ def is_near_month_rollover(user_id: int = None, threshold_minutes: int = 5) -> b
     return False
 
 
+@lru_cache(maxsize=1024)
 def generate_statement_id(user_id: int, month: str, year: int) -> str:
     """Generate immutable statement ID"""
     return f"STMT-{user_id}-{year}-{month}"
@@ -60,43 +87,64 @@ def format_kes(amount: Decimal) -> str:
     return f"KES {amount:,.2f}"
 
 
-def format_number(num: float) -> str:
-    """Format number with commas"""
-    return f"{num:,.2f}"
+CENTS = Decimal("0.01")
+
+
+def round_cents(amount: Decimal) -> Decimal:
+    """Round an amount to whole cents, half up"""
+    # The single rounding step for money: amounts are rounded here as they come
+    # in, so shares, stored values and replies all start from the same figure
+    return amount.quantize(CENTS, rounding=ROUND_HALF_UP)
+
+
+# Split ratios are fixed for the life of the process; kept as exact fractions
+# so splits can be computed on integer cents
+_SPLIT_USER = Fraction(str(config.DEFAULT_SPLIT_USER))
+_SPLIT_PARTNER = Fraction(str(config.DEFAULT_SPLIT_PARTNER))
+# When the ratios add up to 1 the partner gets the remainder, so no cent is lost
+_SPLIT_IS_COMPLETE = _SPLIT_USER + _SPLIT_PARTNER == 1
+
+
+def split_commission(amount: Decimal, is_solo: bool = False) -> Tuple[Decimal, Decimal]:
+    """Split an amount into (user, partner) shares using integer cent math"""
+    amount = round_cents(amount)
+    if is_solo:
+        return amount, Decimal("0.00")
+
+    cents = int(amount.scaleb(2))
+    user_cents = cents * _SPLIT_USER.numerator // _SPLIT_USER.denominator
+    if _SPLIT_IS_COMPLETE:
+        partner_cents = cents - user_cents
+    else:
+        partner_cents = cents * _SPLIT_PARTNER.numerator // _SPLIT_PARTNER.denominator
+    return Decimal(user_cents).scaleb(-2), Decimal(partner_cents).scaleb(-2)
+
+
+class _AmountChars(dict):
+    """str.translate table that keeps digits and '.' and deletes everything else"""
+
+    def __missing__(self, codepoint: int) -> Optional[int]:
+        # Filled in per character on first sight, so later lookups stay in C
+        keep = codepoint if chr(codepoint).isdigit() or codepoint == ord(".") else None
+        self[codepoint] = keep
+        return keep
+
+
+_AMOUNT_CHARS = _AmountChars()
 
 
 def parse_amount(text: str) -> Optional[Decimal]:
     """Parse amount from text (number only)"""
     try:
         # Remove any non-numeric characters except decimal point
-        cleaned = ''.join(c for c in text if c.isdigit() or c == '.')
+        cleaned = text.translate(_AMOUNT_CHARS)
         if cleaned:
-            return Decimal(cleaned)
+            return round_cents(Decimal(cleaned))
     except:
         pass
     return None
 
 
-def is_duplicate(amount: Decimal, recent_commissions: list, window_minutes: int = 2) -> bool:
-    """Check if amount is duplicate within time window"""
-    from dateutil import parser
-    
-    now = datetime.now(pytz.UTC)
-    for comm in recent_commissions:
-        try:
-            comm_time = parser.parse(comm['date_added'])
-            if isinstance(comm_time, datetime) and not comm_time.tzinfo:
-                comm_time = pytz.UTC.localize(comm_time)
-            
-            time_diff = (now - comm_time).total_seconds() / 60
-            
-            if time_diff <= window_minutes and Decimal(comm['amount']) == amount:
-                return True
-        except:
-            continue
-    return False
-
-
 def is_extreme_amount(amount: Decimal, monthly_average: Decimal, multiplier: float = 2.0) -> bool:
     """Check if amount is extreme (>multiplier x monthly average)"""
     if monthly_average == 0:
@@ -104,59 +152,21 @@ def is_extreme_amount(amount: Decimal, monthly_average: Decimal, multiplier: flo
     return amount > (monthly_average * Decimal(str(multiplier)))
 
 
-def get_days_active(commissions: list) -> int:
-    """Get number of unique days with commission entries"""
-    from dateutil import parser
-    
-    days = set()
-    for comm in commissions:
-        try:
-            comm_time = parser.parse(comm['date_added'])
-            days.add(comm_time.date())
-        except:
-            continue
-    return len(days)
-
-
 def get_weekly_totals(commissions: list) -> Dict[str, Decimal]:
     """Get weekly totals from commissions"""
-    from dateutil import parser
-    from collections import defaultdict
     
     weekly = defaultdict(Decimal)
     
     for comm in commissions:
         try:
-            comm_time = parser.parse(comm['date_added'])
+            comm_time = parse_date(comm['date_added'])
             if isinstance(comm_time, datetime) and not comm_time.tzinfo:
-                comm_time = pytz.UTC.localize(comm_time)
+                comm_time = comm_time.replace(tzinfo=timezone.utc)
             
             # Get week number
             week_key = f"Week {comm_time.isocalendar()[1]}"
-            weekly[week_key] += Decimal(comm['amount'])
+            weekly[week_key] += comm['amount']
         except:
             continue
     
     return dict(weekly)
-
-
-def get_daily_totals(commissions: list) -> Dict[str, Decimal]:
-    """Get daily totals from commissions"""
-    from dateutil import parser
-    from collections import defaultdict
-    
-    daily = defaultdict(Decimal)
-    
-    for comm in commissions:
-        try:
-            comm_time = parser.parse(comm['date_added'])
-            if isinstance(comm_time, datetime) and not comm_time.tzinfo:
-                comm_time = pytz.UTC.localize(comm_time)
-            
-            day_key = comm_time.strftime("%Y-%m-%d")
-            daily[day_key] += Decimal(comm['amount'])
-        except:
-            continue
-    
-    return dict(daily)
-